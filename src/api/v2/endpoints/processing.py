@@ -93,10 +93,11 @@ async def process_image(
         image = Image.open(io.BytesIO(image_data))
         
         # Processar imagem
-        result = image_engine.process_image(
-            image=image,
-            operations=[op.dict() for op in request.operations],
-            output_format=request.output_format
+        result = await image_engine.run(
+            image_engine.process_image,
+            image,
+            [op.dict() for op in request.operations],
+            request.output_format
         )
         
         # Converter resultado para bytes
@@ -140,10 +141,11 @@ async def batch_process(
             image = Image.open(io.BytesIO(image_data))
             
             # Processar imagem
-            result = image_engine.process_image(
-                image=image,
-                operations=[op.dict() for op in request.operations],
-                output_format=request.output_format
+            result = await image_engine.run(
+                image_engine.process_image,
+                image,
+                [op.dict() for op in request.operations],
+                request.output_format
             )
             
             # Converter resultado para bytes
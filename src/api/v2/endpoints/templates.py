@@ -370,7 +370,8 @@ async def apply_image_modification(image: Image.Image, mod: TemplateModification
         overlay = await download_image(mod.image_url)
         
         if mod.dimensions:
-            overlay = image_engine.process_image(
+            overlay = await image_engine.run(
+                image_engine.process_image,
                 overlay,
                 operations=[{
                     "type": "resize",
@@ -397,7 +398,8 @@ async def apply_filter_modification(image: Image.Image, mod: TemplateModificatio
     """Aplica filtros na imagem."""
     if mod.effects:
         for effect in mod.effects:
-            image = image_engine.process_image(
+            image = await image_engine.run(
+                image_engine.process_image,
                 image,
                 operations=[{
                     "type": "effect",
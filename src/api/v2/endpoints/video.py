@@ -6,7 +6,7 @@ from typing import List, Dict, Optional, Any
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, File, UploadFile, Query, Body
 from src.api.v2.schemas.requests.video import VideoGenerationRequest
 from src.api.v2.schemas.responses.video import VideoGenerationResponse
-from src.core.gpu.manager import gpu_manager, GPUManager
+from src.core.gpu.manager import get_gpu_manager, GPUManager
 from src.core.queue.manager import queue_manager
 from src.core.cache.manager import cache_manager
 from src.services.thumbnails import thumbnail_service
@@ -160,7 +160,7 @@ async def generate_video(
         required_vram = max(required_vram, 4 * 1024 * 1024 * 1024)  # Mínimo 4GB VRAM
         
         # Verificar disponibilidade de GPU
-        gpu = await gpu_manager.get_available_gpu(min_vram=required_vram)
+        gpu = await get_gpu_manager().get_available_gpu(min_vram=required_vram)
         if not gpu:
             raise HTTPException(
                 status_code=503,
@@ -482,7 +482,7 @@ async def create_video(
         resources = await video_service.estimate_resources(request.dict())
         
         # Verificar GPU disponível
-        gpu = await gpu_manager.get_available_gpu(
+        gpu = await get_gpu_manager().get_available_gpu(
             min_vram=resources['vram_required']
         )
         
@@ -13,7 +13,7 @@ Este arquivo contém a configuração principal da API FastAPI, incluindo:
 import logging
 from fastapi import FastAPI, Header, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from prometheus_client import make_asgi_app
 import os
@@ -35,6 +35,8 @@ from .endpoints import (
 
 # Importação do servidor ComfyUI
 from src.comfy.server import comfy_server
+from src.core.gpu_manager import gpu_manager
+from src.core.gpu.manager import get_gpu_manager
 
 # Configuração da aplicação FastAPI
 app = FastAPI(
@@ -43,6 +45,7 @@ app = FastAPI(
     version="2.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     openapi_tags=[
         {
             "name": "images",
@@ -103,11 +106,18 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Falha na inicialização do ComfyUI: {e}")
         raise RuntimeError("Servidor ComfyUI não inicializado")
+        
+    # Telemetria NVML das GPUs (utilização/temperatura)
+    gpu_manager.start_telemetry()
+    # Métricas, alertas e failover do gerenciador unificado
+    get_gpu_manager().start_monitoring()
 
 # Evento de shutdown para parar o ComfyUI
 @app.on_event("shutdown")
 async def shutdown_event():
     """Para o servidor ComfyUI durante o shutdown da API"""
+    await gpu_manager.stop_telemetry()
+    await get_gpu_manager().stop_monitoring()
     await comfy_server.stop()
     logger.info("ComfyUI parado com sucesso")
 
@@ -115,7 +125,7 @@ async def shutdown_event():
 @app.exception_handler(Exception)
 async def generic_exception_handler(request, exc):
     logger.error(f"Erro não tratado: {exc}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "detail": "Erro interno do servidor",
@@ -128,7 +138,7 @@ async def generic_exception_handler(request, exc):
 async def redis_connection_error(request: Request, exc: ConnectionError):
     """Trata erros de conexão com Redis"""
     logger.error(f"Erro de conexão com Redis: {exc}")
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=503,
         content={"detail": "Serviço temporariamente indisponível"}
     )
@@ -198,11 +208,19 @@ async def check_redis_health(request: Request, call_next):
         return await call_next(request)
     except Exception as e:
         logger.error(f"Redis não está saudável: {e}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=503,
             content={"detail": "Serviço temporariamente indisponível"}
         )
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info") 
\ No newline at end of file
+    # uvloop dobra o throughput de I/O do asyncpg; indisponível no Windows
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        log_level="info",
+        loop="uvloop" if sys.platform != "win32" else "asyncio"
+    ) 
\ No newline at end of file
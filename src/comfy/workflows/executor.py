@@ -10,7 +10,7 @@ from typing import Dict, List, Optional, Union
 from prometheus_client import Counter, Histogram
 
 from src.comfy.workflows.manager import workflow_manager
-from src.core.gpu.manager import gpu_manager
+from src.core.gpu.manager import get_gpu_manager
 
 logger = logging.getLogger(__name__)
 
@@ -56,7 +56,7 @@ class WorkflowExecutor:
         """
         # Aloca GPU se necessário
         if gpu_id is None:
-            gpu_id = await gpu_manager.allocate_gpu()
+            gpu_id = await get_gpu_manager().allocate_gpu()
             
         try:
             # Carrega e executa o workflow
@@ -88,7 +88,7 @@ class WorkflowExecutor:
         except Exception as e:
             logger.error(f"Erro ao executar workflow {template_name}: {e}")
             if gpu_id is not None:
-                await gpu_manager.release_gpu(gpu_id)
+                await get_gpu_manager().release_gpu(gpu_id)
             raise
             
     async def get_status(self, prompt_id: str) -> Dict:
@@ -132,7 +132,7 @@ class WorkflowExecutor:
                     # Libera GPU
                     gpu_id = self.active_workflows[prompt_id]["gpu_id"]
                     if gpu_id is not None:
-                        await gpu_manager.release_gpu(gpu_id)
+                        await get_gpu_manager().release_gpu(gpu_id)
                     
                     # Atualiza status
                     self.active_workflows[prompt_id]["status"] = "completed"
@@ -153,7 +153,7 @@ class WorkflowExecutor:
                     # Libera GPU
                     gpu_id = self.active_workflows[prompt_id]["gpu_id"]
                     if gpu_id is not None:
-                        await gpu_manager.release_gpu(gpu_id)
+                        await get_gpu_manager().release_gpu(gpu_id)
                     
                     # Atualiza status
                     self.active_workflows[prompt_id]["status"] = "failed"
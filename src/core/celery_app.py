@@ -8,7 +8,7 @@ from celery.signals import worker_ready
 from prometheus_client import Counter, Histogram
 
 from src.core.config import settings
-from src.core.gpu.manager import gpu_manager
+from src.core.gpu.manager import get_gpu_manager
 from src.core.initialization import cache_manager
 from src.core.logger import logger
 
@@ -82,7 +82,7 @@ def init_worker(sender=None, **kwargs):
 async def async_init_worker():
     """Função assíncrona real de inicialização"""
     await cache_manager.ensure_connection()
-    await gpu_manager.initialize()
+    await get_gpu_manager().initialize()
 
 # Importa tarefas
 import src.generation.image.tasks
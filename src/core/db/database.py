@@ -1,5 +1,11 @@
-"""Configuração do banco de dados"""
-from sqlalchemy import create_engine
+"""
+Configuração do banco de dados.
+
+O desempenho das sessões assíncronas (asyncpg) pressupõe o event loop uvloop,
+usado pelo entrypoint (uvicorn --loop uvloop).
+"""
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import NullPool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
@@ -11,15 +17,29 @@ if settings.ENVIRONMENT == "development":
     # SQLite
     SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
     ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./sql_app.db"
-    # SQLite não suporta os mesmos parâmetros de pool que PostgreSQL
+    # SQLite aceita um único escritor: NullPool abre uma conexão por uso
+    # em vez de manter conexões (e locks) presas em um pool
     engine = create_engine(
         SQLALCHEMY_DATABASE_URL,
-        connect_args={"check_same_thread": False}
+        connect_args={"check_same_thread": False, "timeout": 30},
+        poolclass=NullPool
     )
     async_engine = create_async_engine(
         ASYNC_DATABASE_URL,
-        echo=settings.DB_DEBUG
+        echo=settings.DB_DEBUG,
+        connect_args={"check_same_thread": False, "timeout": 30},
+        poolclass=NullPool
     )
+
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Habilita WAL para leituras concorrentes com a escrita"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
 else:
     # PostgreSQL
     SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL.replace(
@@ -3,43 +3,95 @@ Módulo de diagnóstico para identificar e corrigir problemas na inicialização
 """
 import os
 import sys
+import asyncio
+import time
 import logging
-import importlib
-import subprocess
+from importlib.util import find_spec
 from pathlib import Path
-from typing import List, Dict, Any
-import redis
+from typing import List, Dict, Any, Optional, Tuple
+import redis.asyncio as aioredis
 import psutil
 import uvicorn
 
 logger = logging.getLogger(__name__)
 
+# Propriedades das GPUs lidas uma única vez no import; None = PyTorch ausente
+try:
+    import torch
+    _GPU_INFO: Optional[List[Any]] = (
+        [torch.cuda.get_device_properties(i) for i in range(torch.cuda.device_count())]
+        if torch.cuda.is_available() else []
+    )
+except ImportError:
+    _GPU_INFO = None
+except Exception as e:
+    logger.warning(f"Erro ao consultar GPUs: {e}")
+    _GPU_INFO = []
+
+# Máscaras octais pré-calculadas para as combinações de permissões
+_PERM_MASK = {"rwx": 7, "rw": 6, "rx": 5, "r": 4, "wx": 3, "w": 2, "x": 1}
+
 class APIDiagnostics:
+    # Validade (s) do resultado completo e de um ping bem sucedido ao Redis
+    RESULT_TTL = 30
+    SERVICE_TTL = 5
+
+    # Último diagnóstico bem sucedido: (timestamp, sucesso, erros, avisos)
+    _cached_result: Optional[Tuple[float, bool, List[Dict[str, Any]], List[Dict[str, Any]]]] = None
+    _redis_ok_at: Optional[float] = None
+
     def __init__(self):
         self.errors: List[Dict[str, Any]] = []
         self.warnings: List[Dict[str, Any]] = []
         self.fixes_applied: List[str] = []
+        self._force = False
+
+    async def run_full_diagnostic(self, force: bool = False) -> bool:
+        """
+        Executa diagnóstico completo do sistema.
+        
+        Args:
+            force: Ignora resultados em cache e refaz todas as verificações
+        """
+        cached = APIDiagnostics._cached_result
+        if not force and cached and time.monotonic() - cached[0] < self.RESULT_TTL:
+            _, success, errors, warnings = cached
+            self.errors = list(errors)
+            self.warnings = list(warnings)
+            return success
+        
+        self._force = force
+        success = await self._run_checks()
+        # Falhas não são cacheadas: correções aplicadas devem ser reavaliadas
+        if success:
+            APIDiagnostics._cached_result = (
+                time.monotonic(), success, list(self.errors), list(self.warnings)
+            )
+        return success
 
-    async def run_full_diagnostic(self) -> bool:
-        """Executa diagnóstico completo do sistema"""
+    async def _run_checks(self) -> bool:
+        """Executa as verificações e aplica correções"""
         try:
-            # 1. Verificar ambiente Python
-            self._check_python_environment()
-            
-            # 2. Verificar dependências
-            self._check_dependencies()
-            
-            # 3. Verificar configurações
-            await self._check_settings()
-            
-            # 4. Verificar sistema de arquivos
-            self._check_filesystem()
-            
-            # 5. Verificar serviços externos
-            await self._check_external_services()
+            # 1-6. Verificações independentes executadas em paralelo;
+            # as síncronas rodam em threads para não bloquear o loop
+            results = await asyncio.gather(
+                asyncio.to_thread(self._check_python_environment),
+                asyncio.to_thread(self._check_dependencies),
+                self._check_settings(),
+                asyncio.to_thread(self._check_filesystem),
+                self._check_external_services(),
+                asyncio.to_thread(self._check_gpu_setup),
+                return_exceptions=True
+            )
             
-            # 6. Verificar GPUs
-            self._check_gpu_setup()
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Erro durante verificação: {str(result)}")
+                    self.errors.append({
+                        "type": "diagnostic_error",
+                        "message": str(result),
+                        "critical": True
+                    })
             
             # 7. Aplicar correções
             if self.errors:
@@ -75,15 +127,19 @@ class APIDiagnostics:
 
     def _check_dependencies(self):
         """Verifica dependências do projeto"""
-        required_packages = [
-            'fastapi', 'uvicorn', 'redis', 'pydantic',
-            'python-jose[cryptography]', 'passlib[bcrypt]'
-        ]
+        # Pacote pip -> módulo importável
+        required_packages = {
+            'fastapi': 'fastapi',
+            'uvicorn': 'uvicorn',
+            'redis': 'redis',
+            'pydantic': 'pydantic',
+            'python-jose[cryptography]': 'jose',
+            'passlib[bcrypt]': 'passlib'
+        }
         
-        for package in required_packages:
-            try:
-                importlib.import_module(package.split('[')[0])
-            except ImportError:
+        for package, module in required_packages.items():
+            # find_spec localiza o módulo sem executar sua inicialização
+            if find_spec(module) is None:
                 self.errors.append({
                     "type": "missing_dependency",
                     "message": f"Pacote {package} não encontrado",
@@ -138,7 +194,10 @@ class APIDiagnostics:
         ]
         
         for path, required_perms in required_permissions:
-            if not os.path.exists(path):
+            # Um único stat() informa existência e permissões
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
                 self.errors.append({
                     "type": "missing_path",
                     "message": f"Caminho não encontrado: {path}",
@@ -148,7 +207,7 @@ class APIDiagnostics:
                 continue
                 
             # Verificar permissões
-            current_perms = oct(os.stat(path).st_mode)[-3:]
+            current_perms = oct(st.st_mode)[-3:]
             if not self._check_permissions(current_perms, required_perms):
                 self.errors.append({
                     "type": "invalid_permissions",
@@ -161,15 +220,23 @@ class APIDiagnostics:
     async def _check_external_services(self):
         """Verifica serviços externos"""
         # Verificar Redis
+        ok_at = APIDiagnostics._redis_ok_at
+        if not self._force and ok_at and time.monotonic() - ok_at < self.SERVICE_TTL:
+            return
+            
         try:
             from src.core.config import settings
-            r = redis.Redis(
+            r = aioredis.Redis(
                 host=settings.REDIS_HOST,
                 port=settings.REDIS_PORT,
                 db=settings.REDIS_DB,
                 socket_timeout=1
             )
-            r.ping()
+            try:
+                await asyncio.wait_for(r.ping(), timeout=2)
+            finally:
+                await r.close()
+            APIDiagnostics._redis_ok_at = time.monotonic()
         except Exception as e:
             self.errors.append({
                 "type": "redis_error",
@@ -179,37 +246,34 @@ class APIDiagnostics:
 
     def _check_gpu_setup(self):
         """Verifica configuração das GPUs"""
-        try:
-            import torch
-            if not torch.cuda.is_available():
-                self.warnings.append({
-                    "type": "gpu_not_available",
-                    "message": "CUDA não disponível"
-                })
-            else:
-                # Verificar memória disponível
-                for i in range(torch.cuda.device_count()):
-                    free_mem = torch.cuda.get_device_properties(i).total_memory
-                    if free_mem < 8 * 1024 * 1024 * 1024:  # 8GB
-                        self.warnings.append({
-                            "type": "low_gpu_memory",
-                            "message": f"GPU {i} com pouca memória: {free_mem/1024/1024/1024:.1f}GB"
-                        })
-        except ImportError:
+        if _GPU_INFO is None:
             self.warnings.append({
                 "type": "torch_not_found",
                 "message": "PyTorch não instalado"
             })
+        elif not _GPU_INFO:
+            self.warnings.append({
+                "type": "gpu_not_available",
+                "message": "CUDA não disponível"
+            })
+        else:
+            # Verificar memória disponível
+            for i, props in enumerate(_GPU_INFO):
+                free_mem = props.total_memory
+                if free_mem < 8 * 1024 * 1024 * 1024:  # 8GB
+                    self.warnings.append({
+                        "type": "low_gpu_memory",
+                        "message": f"GPU {i} com pouca memória: {free_mem/1024/1024/1024:.1f}GB"
+                    })
 
     async def _apply_fixes(self):
         """Aplica correções para os problemas encontrados"""
         for error in self.errors:
             if error.get("fix") == "install_package":
-                subprocess.run([
-                    sys.executable, "-m", "pip", "install",
-                    error["package"]
-                ])
-                self.fixes_applied.append(f"Instalado {error['package']}")
+                if await self._run_command(
+                    sys.executable, "-m", "pip", "install", error["package"]
+                ):
+                    self.fixes_applied.append(f"Instalado {error['package']}")
                 
             elif error.get("fix") == "create_directory":
                 os.makedirs(error["path"], exist_ok=True)
@@ -220,20 +284,39 @@ class APIDiagnostics:
                 self.fixes_applied.append(f"Corrigidas permissões de {error['path']}")
                 
             elif error.get("fix") == "start_redis":
-                subprocess.run(["service", "redis-server", "start"])
-                self.fixes_applied.append("Iniciado servidor Redis")
+                if await self._run_command("service", "redis-server", "start"):
+                    self.fixes_applied.append("Iniciado servidor Redis")
                 
             elif error.get("fix") == "generate_secret_key":
                 import secrets
                 os.environ["SECRET_KEY"] = secrets.token_urlsafe(32)
                 self.fixes_applied.append("Gerada nova SECRET_KEY")
 
+    async def _run_command(self, *args: str) -> bool:
+        """Executa um comando sem bloquear o event loop; retorna True em caso de sucesso"""
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await proc.communicate()
+        except OSError as e:
+            logger.error(f"Erro ao executar {args[0]}: {str(e)}")
+            return False
+            
+        if proc.returncode != 0:
+            logger.error(
+                f"Comando {' '.join(args)} falhou ({proc.returncode}): "
+                f"{stderr.decode(errors='replace').strip()}"
+            )
+            return False
+        return True
+
     def _check_permissions(self, current: str, required: str) -> bool:
         """Verifica se as permissões atuais atendem aos requisitos"""
-        permission_map = {'r': 4, 'w': 2, 'x': 1}
-        current_num = int(current, 8)
-        required_num = sum(permission_map[p] for p in required)
-        return (current_num & required_num) == required_num
+        mask = _PERM_MASK[required]
+        return (int(current, 8) & mask) == mask
 
     def print_report(self):
         """Imprime relatório do diagnóstico"""
@@ -257,9 +340,9 @@ class APIDiagnostics:
         if not self.errors and not self.warnings:
             print("✅ Nenhum problema encontrado!")
 
-async def run_diagnostics():
+async def run_diagnostics(force: bool = False):
     """Função auxiliar para executar diagnóstico"""
     diagnostics = APIDiagnostics()
-    success = await diagnostics.run_full_diagnostic()
+    success = await diagnostics.run_full_diagnostic(force=force)
     diagnostics.print_report()
     return success 
\ No newline at end of file
@@ -4,22 +4,38 @@ Exceções e handlers de erro unificados.
 
 from typing import Any, Dict, Optional, Union
 from fastapi import HTTPException, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from fastapi.exceptions import RequestValidationError
+from starlette.concurrency import run_in_threadpool
 from prometheus_client import Counter
 import logging
-import traceback
+
+from src.core.middleware.request_id import request_id_var
 
 # Métricas
 ERROR_COUNTS = Counter('error_count_total', 'Total de erros por tipo', ['type'])
 
 logger = logging.getLogger(__name__)
 
+# Filhos do ERROR_COUNTS já resolvidos por código de erro
+_ERROR_CHILDREN: Dict[str, Any] = {}
+
+def _err(code: str):
+    """Retorna o filho pré-vinculado do ERROR_COUNTS para o código"""
+    child = _ERROR_CHILDREN.get(code)
+    if child is None:
+        child = _ERROR_CHILDREN.setdefault(code, ERROR_COUNTS.labels(code))
+    return child
+
+def _count_error(code: str):
+    """Conta um erro no filho já vinculado do ERROR_COUNTS"""
+    _err(code).inc()
+
 class BaseError(Exception):
     """Classe base para exceções personalizadas"""
     def __init__(self, message: str = None):
         self.message = message
-        super().__init__(self.message)
+        super().__init__(message)
 
 class APIError(HTTPException):
     """Erro base para exceções da API"""
@@ -33,7 +49,7 @@ class APIError(HTTPException):
         super().__init__(status_code=status_code, detail=message)
         self.error_code = error_code
         self.details = details or {}
-        ERROR_COUNTS.labels(error_code).inc()
+        _count_error(error_code)
 
 class ResourceError(APIError):
     pass
@@ -114,10 +130,35 @@ class InsufficientVRAMError(GPUError):
         self.required_vram = required_vram
         self.available_vram = available_vram
         self.gpu_id = gpu_id
-        message = f"VRAM insuficiente: necessário {required_vram/1e9:.1f}GB, disponível {available_vram/1e9:.1f}GB"
-        if gpu_id is not None:
-            message += f" na GPU {gpu_id}"
-        super().__init__(message)
+        # A mensagem só é formatada (uma vez) quando lida; sob disputa de
+        # VRAM a maioria das instâncias é descartada sem ser exibida
+        super().__init__()
+
+    @property
+    def message(self) -> str:
+        if self._message is None:
+            message = (
+                f"VRAM insuficiente: necessário {self.required_vram/1e9:.1f}GB, "
+                f"disponível {self.available_vram/1e9:.1f}GB"
+            )
+            if self.gpu_id is not None:
+                message += f" na GPU {self.gpu_id}"
+            self._message = message
+            self.args = (message,)
+        return self._message
+
+    @message.setter
+    def message(self, value: Optional[str]):
+        self._message = value
+
+    def __str__(self) -> str:
+        return self.message
+
+    def __repr__(self) -> str:
+        return (
+            f"{type(self).__name__}(required_vram={self.required_vram}, "
+            f"available_vram={self.available_vram}, gpu_id={self.gpu_id})"
+        )
 
 class PreemptionError(GPUError):
     """
@@ -207,10 +248,21 @@ class DiskSpaceError(ResourceError):
     def __init__(self, required_space: int, available_space: int):
         self.required_space = required_space
         self.available_space = available_space
-        super().__init__(
-            f"Espaço insuficiente em disco: necessário {required_space/1e9:.1f}GB, "
-            f"disponível {available_space/1e9:.1f}GB"
-        )
+        # detail é formatado dos campos na primeira leitura
+        super().__init__(None)
+
+    @property
+    def detail(self) -> str:
+        if self._detail is None:
+            self._detail = (
+                f"Espaço insuficiente em disco: necessário {self.required_space/1e9:.1f}GB, "
+                f"disponível {self.available_space/1e9:.1f}GB"
+            )
+        return self._detail
+
+    @detail.setter
+    def detail(self, value: Optional[str]):
+        self._detail = value
 
 class MemoryError(ResourceError):
     """
@@ -219,10 +271,21 @@ class MemoryError(ResourceError):
     def __init__(self, required_memory: int, available_memory: int):
         self.required_memory = required_memory
         self.available_memory = available_memory
-        super().__init__(
-            f"Memória RAM insuficiente: necessário {required_memory/1e9:.1f}GB, "
-            f"disponível {available_memory/1e9:.1f}GB"
-        )
+        # detail é formatado dos campos na primeira leitura
+        super().__init__(None)
+
+    @property
+    def detail(self) -> str:
+        if self._detail is None:
+            self._detail = (
+                f"Memória RAM insuficiente: necessário {self.required_memory/1e9:.1f}GB, "
+                f"disponível {self.available_memory/1e9:.1f}GB"
+            )
+        return self._detail
+
+    @detail.setter
+    def detail(self, value: Optional[str]):
+        self._detail = value
 
 # Erros de Processamento
 class GenerationError(ProcessingError):
@@ -236,9 +299,9 @@ class GenerationError(ProcessingError):
         super().__init__(message)
 
 # Handlers de Erro
-async def api_error_handler(request: Request, exc: APIError) -> JSONResponse:
+async def api_error_handler(request: Request, exc: APIError) -> ORJSONResponse:
     """Handler para erros da API"""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "error": {
@@ -249,33 +312,55 @@ async def api_error_handler(request: Request, exc: APIError) -> JSONResponse:
         }
     )
 
+# Tamanho máximo do corpo ecoado em respostas de validação
+MAX_ERROR_BODY_PREVIEW = 2048
+
+def _body_preview(body: Any) -> Any:
+    """Trunca corpos brutos grandes (uploads de mídia) antes de ecoá-los"""
+    if isinstance(body, (bytes, bytearray)):
+        preview = bytes(body[:MAX_ERROR_BODY_PREVIEW]).decode("utf-8", errors="replace")
+        return preview + "...<truncated>" if len(body) > MAX_ERROR_BODY_PREVIEW else preview
+    if isinstance(body, str) and len(body) > MAX_ERROR_BODY_PREVIEW:
+        return body[:MAX_ERROR_BODY_PREVIEW] + "...<truncated>"
+    return body
+
 async def validation_error_handler(
     request: Request,
     exc: RequestValidationError
-) -> JSONResponse:
+) -> ORJSONResponse:
     """Handler para erros de validação do FastAPI"""
-    ERROR_COUNTS.labels("validation_error").inc()
-    return JSONResponse(
-        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-        content={
-            "error": {
-                "code": "validation_error",
-                "message": "Validation error",
-                "details": {
-                    "errors": exc.errors(),
-                    "body": exc.body
-                }
+    _count_error("validation_error")
+    body = _body_preview(exc.body)
+    content = {
+        "error": {
+            "code": "validation_error",
+            "message": "Validation error",
+            "details": {
+                "errors": exc.errors(),
+                "body": body
             }
         }
+    }
+    
+    # Corpos estruturados não são truncáveis: serializa fora do event loop
+    if isinstance(body, (dict, list)):
+        return await run_in_threadpool(
+            ORJSONResponse,
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            content=content
+        )
+    return ORJSONResponse(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        content=content
     )
 
 async def http_exception_handler(
     request: Request,
     exc: HTTPException
-) -> JSONResponse:
+) -> ORJSONResponse:
     """Handler para exceções HTTP do FastAPI"""
-    ERROR_COUNTS.labels("http_error").inc()
-    return JSONResponse(
+    _count_error("http_error")
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "error": {
@@ -288,10 +373,10 @@ async def http_exception_handler(
 async def python_exception_handler(
     request: Request,
     exc: Exception
-) -> JSONResponse:
+) -> ORJSONResponse:
     """Handler para exceções Python não tratadas"""
-    ERROR_COUNTS.labels("internal_error").inc()
-    return JSONResponse(
+    _count_error("internal_error")
+    return ORJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={
             "error": {
@@ -308,30 +393,38 @@ async def python_exception_handler(
 async def error_handler(
     request: Request,
     exc: Union[Exception, HTTPException]
-) -> JSONResponse:
+) -> ORJSONResponse:
     """Handler global de erros"""
     
-    # Log do erro
-    error_details = {
-        "path": str(request.url),
+    # Campos estruturados: o JsonFormatter (pythonjsonlogger) os emite como
+    # chaves próprias; a mensagem só é interpolada se o registro for emitido
+    fields = {
         "method": request.method,
-        "error": str(exc),
-        "traceback": traceback.format_exc()
+        "path": request.url.path,
+        "exc_type": type(exc).__name__,
     }
-    logger.error(f"Error handling request: {error_details}")
     
-    # Resposta para o cliente
+    # Erros HTTP são esperados: registrados sem traceback
     if isinstance(exc, HTTPException):
-        return JSONResponse(
+        fields["status_code"] = exc.status_code
+        logger.warning(
+            "Error handling request: %(method)s %(path)s -> %(status_code)s",
+            fields, extra=fields
+        )
+        return ORJSONResponse(
             status_code=exc.status_code,
             content={"detail": exc.detail}
         )
         
-    # Erro interno
-    return JSONResponse(
+    # Erro interno: o traceback só é formatado se o registro for emitido
+    logger.error(
+        "Error handling request: %(method)s %(path)s: %(exc_type)s",
+        fields, extra=fields, exc_info=exc
+    )
+    return ORJSONResponse(
         status_code=500,
         content={
             "detail": "Internal server error",
-            "error_id": str(request.state.request_id)
+            "error_id": request_id_var.get()
         }
     ) 
\ No newline at end of file
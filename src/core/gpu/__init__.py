@@ -1,4 +1,4 @@
 """GPU management module"""
-from .manager import GPUManager, gpu_manager
+from .manager import GPUManager, get_gpu_manager
 
-__all__ = ['GPUManager', 'gpu_manager'] 
\ No newline at end of file
+__all__ = ['GPUManager', 'get_gpu_manager'] 
\ No newline at end of file
@@ -4,16 +4,17 @@ Implementa estratégias de otimização para 4x RTX 4090.
 """
 
 import asyncio
+import heapq
 import logging
 import time
-from typing import Dict, List, Optional, Set, Tuple
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from dataclasses import dataclass
 import torch
 import pynvml
-from prometheus_client import Gauge, start_http_server
-import sys
 import psutil
 import gc
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 from src.config.gpu_config import get_gpu_config
 from src.core.cache import cache
@@ -23,10 +24,21 @@ from src.core.monitoring.metrics import GPU_METRICS
 # Configuração de logging
 logger = logging.getLogger(__name__)
 
-# Métricas Prometheus
-GPU_MEMORY = Gauge('gpu_memory_usage', 'Uso de memória GPU', ['device'])
-GPU_UTIL = Gauge('gpu_utilization', 'Utilização da GPU', ['device'])
-GPU_TEMP = Gauge('gpu_temperature', 'Temperatura da GPU', ['device'])
+# Chamadas NVML bloqueiam e a libnvidia-ml não é totalmente thread-safe:
+# todas as do processo, de qualquer gerenciador, passam por esta única thread
+NVML_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nvml")
+
+# Última leitura NVML de cada GPU em layout colunar: uma linha por GPU,
+# alocada uma vez e sobrescrita a cada coleta
+TELEMETRY_DTYPE = np.dtype([
+    ('ts', np.float64),
+    ('mem_total', np.int64),
+    ('mem_used', np.int64),
+    ('mem_free', np.int64),
+    ('cached_free', np.int64),
+    ('util', np.uint8),
+    ('temp', np.int16)
+])
 
 @dataclass
 class GPUTask:
@@ -35,7 +47,7 @@ class GPUTask:
     gpu_id: int
     vram_required: int
     priority: int = 0
-    start_time: Optional[float] = None
+    start_time: Optional[float] = None  # time.monotonic(); só usado para medir runtime
 
 @dataclass
 class PreemptionCandidate:
@@ -61,6 +73,21 @@ class GPUManager:
     - Cache de predições
     """
     
+    # Ciclos de métricas entre leituras dos contadores NVLink
+    NVLINK_SAMPLE_TICKS = 5
+    # Erros NVML que indicam falta definitiva de suporte aos field values
+    NVLINK_FIELDS_UNSUPPORTED = (
+        getattr(pynvml, 'NVML_ERROR_NOT_SUPPORTED', None),
+        getattr(pynvml, 'NVML_ERROR_FUNCTION_NOT_FOUND', None)
+    )
+    # A coleta deve ocupar no máximo 1/N do intervalo (~5% com N=20)
+    MONITOR_OVERHEAD_FACTOR = 20
+    # Teto do recuo exponencial quando o driver não responde (segundos):
+    # com o driver fora, o NVML é sondado no máximo a cada 10 minutos
+    MAX_MONITOR_BACKOFF = 600
+    # Falhas NVML acumuladas a partir das quais a GPU entra em failover
+    MAX_NVML_ERRORS = 10
+    
     def __init__(self):
         """Inicializa o gerenciador unificado de GPUs"""
         self.config = get_gpu_config()
@@ -70,12 +97,56 @@ class GPUManager:
         self.gpus = []
         self.tasks: Dict[str, GPUTask] = {}
         self.failed_gpus: Set[int] = set()
-        self.lock = asyncio.Lock()
+        # Alocação e liberação não têm await entre a escolha da GPU e a
+        # mutação, logo já são atômicas no event loop e dispensam lock. O
+        # global serializa apenas preempção e failover entre si
+        self.global_lock = asyncio.Lock()
+        
+        # GPUs sinalizadas por _update_metrics, aguardando failover
+        self._unhealthy: Set[int] = set()
+        self._unhealthy_event = asyncio.Event()
+        
+        # Loops de métricas e failover, iniciados pelo lifespan da aplicação
+        self._monitor_tasks: List[asyncio.Task] = []
+        
+        # Thread NVML compartilhada do processo
+        self._nvml_executor = NVML_EXECUTOR
+        
+        # VRAM de fato disponível no dispositivo (livre no driver + cache
+        # ocioso do alocador do PyTorch), amostrada por _update_metrics. A
+        # contabilidade em used_memory não vê outros processos nem a
+        # fragmentação acumulada após muitos ciclos de alocação
+        self._device_free: Dict[int, int] = {}
+        
+        # Contadores NVLink são cumulativos: a taxa sai da diferença entre
+        # leituras, amostradas a cada NVLINK_SAMPLE_TICKS ciclos de métricas
+        self._metrics_tick = 0
+        # {(gpu, par): (contador, ts, batched)}; a taxa só compara leituras
+        # do mesmo modo, pois field values e contadores por link têm unidades
+        # diferentes
+        self._last_nvlink: Dict[Tuple[int, int], Tuple[int, float, bool]] = {}
+        
+        # Heap de alocação com remoção preguiçosa: cada mutação de uma GPU
+        # incrementa sua versão e invalida as entradas anteriores
+        self._gpu_heap: List[Tuple[int, int, int, int, int]] = []
+        self._gpu_versions: Dict[int, int] = {}
+        
+        # Links NVLink ativos por GPU e par: {gpu_id: {peer_id: [link, ...]}}
+        self._nvlink_links: Dict[int, Dict[int, List[int]]] = {}
+        # Campos (field_id, link) lidos em lote por nvmlDeviceGetFieldValues,
+        # montados na inicialização para a thread NVML apenas lê-los
+        self._nvlink_field_ids: Dict[int, List[Tuple[int, int]]] = {}
         
         # Inicialização
         self._init_nvml()
+        
+        # Última leitura NVML por GPU (TELEMETRY_DTYPE); ts=-inf marca
+        # linha ainda não coletada
+        self._telemetry = np.zeros(self.num_gpus, dtype=TELEMETRY_DTYPE)
+        self._telemetry['ts'] = -np.inf
         self._init_gpus()
         self.metrics = GPU_METRICS
+        self._bind_metrics()
         
         # Mapa de VRAM por tipo de tarefa
         self.vram_map = {
@@ -90,14 +161,50 @@ class GPUManager:
         }
         
     def _init_nvml(self):
-        """Inicializa NVIDIA Management Library"""
-        pynvml.nvmlInit()
+        """
+        Inicializa NVIDIA Management Library.
+        
+        Sem driver NVIDIA funcional o gerenciador fica desabilitado (sem GPUs
+        e sem monitoramento), em vez de sondar o driver a cada ciclo.
+        """
+        self.handles = {}
+        self._bus_to_gpu = {}
+        self._mem_version = None
+        self._nvlink_batched = False
+        try:
+            pynvml.nvmlInit()
+        except pynvml.NVMLError as e:
+            logger.warning(f"NVML indisponível, gerenciamento de GPUs desabilitado: {e}")
+            self._nvml_disabled = True
+            self.num_gpus = 0
+            return
+        self._nvml_disabled = False
+        
         self.num_gpus = pynvml.nvmlDeviceGetCount()
         self.handles = {
             i: pynvml.nvmlDeviceGetHandleByIndex(i)
             for i in range(self.num_gpus)
         }
         
+        # Índice de endereço PCI (domain, bus, device) -> GPU para resolver
+        # pares NVLink; chaves inteiras em vez da string busId
+        self._bus_to_gpu = {
+            self._pci_key(pynvml.nvmlDeviceGetPciInfo(h)): i
+            for i, h in self.handles.items()
+        }
+        
+        # Struct de memória v2 (inclui a reservada) se binding e driver suportarem
+        self._mem_version = getattr(pynvml, 'nvmlMemory_v2', None)
+        if self._mem_version is not None and self.num_gpus:
+            try:
+                pynvml.nvmlDeviceGetMemoryInfo(self.handles[0], version=self._mem_version)
+            except (TypeError, pynvml.NVMLError):
+                self._mem_version = None
+                
+        # Throughput NVLink por field values: uma chamada por GPU para todos
+        # os links, em vez de uma por link
+        self._nvlink_batched = hasattr(pynvml, 'NVML_FI_DEV_NVLINK_THROUGHPUT_DATA_RX')
+        
     def _init_gpus(self):
         """Inicializa lista de GPUs disponíveis"""
         if not torch.cuda.is_available():
@@ -110,245 +217,522 @@ class GPUManager:
                 "id": gpu_id,
                 "total_memory": total_memory,
                 "used_memory": 0,
-                "tasks": [],
+                "tasks": set(),
                 "nvlink_peers": self._get_nvlink_peers(gpu_id)
             })
             logger.info(f"GPU {gpu_id} inicializada: {total_memory/1024**3:.1f}GB VRAM")
             
-    def _init_metrics(self):
-        """Registra métricas Prometheus"""
-        self.metrics = {
-            'vram_used': Gauge('gpu_vram_used', 'VRAM Utilizada em bytes', ['gpu_id']),
-            'vram_total': Gauge('gpu_vram_total', 'VRAM Total em bytes', ['gpu_id']),
-            'utilization': Gauge('gpu_utilization', 'Utilização da GPU em %', ['gpu_id']),
-            'temperature': Gauge('gpu_temperature', 'Temperatura da GPU em °C', ['gpu_id']),
-            'nvlink_speed': Gauge('gpu_nvlink_speed', 'Velocidade NVLink em GB/s', ['gpu_id', 'peer_id']),
-            'task_count': Gauge('gpu_task_count', 'Número de tarefas ativas', ['gpu_id']),
-            'errors': Gauge('gpu_errors', 'Contagem de erros', ['gpu_id'])
-        }
+        for gpu in self.gpus:
+            self._push_gpu(gpu)
+            
+    def _push_gpu(self, gpu: Dict):
+        """
+        Registra o estado atual da GPU no heap de alocação.
+        
+        A chave reproduz a ordem de preferência: mais conexões NVLink,
+        mais memória livre e menos tarefas.
+        """
+        gpu_id = gpu['id']
+        version = self._gpu_versions.get(gpu_id, 0) + 1
+        self._gpu_versions[gpu_id] = version
+        heapq.heappush(self._gpu_heap, (
+            -len(gpu['nvlink_peers']),
+            -(gpu['total_memory'] - gpu['used_memory']),
+            len(gpu['tasks']),
+            gpu_id,
+            version
+        ))
         
-        # Inicializa valores
+        # Compacta o heap quando as entradas obsoletas dominam
+        if len(self._gpu_heap) > 4 * len(self.gpus):
+            self._gpu_heap = [
+                e for e in self._gpu_heap if e[4] == self._gpu_versions[e[3]]
+            ]
+            heapq.heapify(self._gpu_heap)
+            
+    def _pop_gpu_for(self, required_memory: int) -> Optional[Dict]:
+        """Retorna a GPU preferida com memória livre suficiente, sem alterá-la"""
+        popped = []
+        chosen = None
+        while self._gpu_heap:
+            entry = heapq.heappop(self._gpu_heap)
+            gpu_id, version = entry[3], entry[4]
+            if version != self._gpu_versions[gpu_id]:
+                continue  # Entrada obsoleta
+            popped.append(entry)
+            if (
+                gpu_id not in self.failed_gpus
+                and -entry[1] >= required_memory
+                and self._device_free.get(gpu_id, required_memory) >= required_memory
+            ):
+                chosen = self.gpus[gpu_id]
+                break
+                
+        for entry in popped:
+            heapq.heappush(self._gpu_heap, entry)
+        return chosen
+            
+    def _bind_metrics(self):
+        """Pré-vincula os filhos das métricas de cada GPU, evitando .labels() no loop"""
+        self._gauges: Dict[int, Dict] = {}
+        self._last_published: Dict[Tuple[int, str], float] = {}
+        # Contagem local de falhas NVML; a saúde é avaliada sobre ela em vez
+        # de ler o valor interno (com lock) do Counter
+        self._nvml_errors = np.zeros(self.num_gpus, dtype=np.int64)
         for gpu in self.gpus:
             gpu_id = gpu['id']
-            self.metrics['vram_total'].labels(gpu_id).set(gpu['total_memory'])
-        
-        # Inicia servidor de métricas, encerrando caso a porta 8001 esteja ocupada
-        try:
-            start_http_server(8001)
-            print("Métricas Prometheus iniciadas na porta 8001")
-        except OSError as e:
-            if "Address already in use" in str(e):
-                logger.error("Porta 8001 já está em uso. Encerrando o processo.")
-                sys.exit(1)
-            else:
-                raise
-            
-    def _start_monitoring(self):
-        """Inicia loops de monitoramento"""
+            device = str(gpu_id)
+            self._gauges[gpu_id] = {
+                'memory': self.metrics['memory'].labels(device=device),
+                'utilization': self.metrics['utilization'].labels(device=device),
+                'temperature': self.metrics['temperature'].labels(device=device),
+                'tasks': self.metrics['tasks'].labels(device=device),
+                'errors': self.metrics['errors'].labels(device=device, type='nvml'),
+                'nvlink': {
+                    peer_id: self.metrics['nvlink'].labels(device=device, peer=str(peer_id))
+                    for peer_id in gpu['nvlink_peers']
+                }
+            }
+            
+    def start_monitoring(self):
+        """Inicia loops de monitoramento; chamado no startup da aplicação"""
+        if self._monitor_tasks:
+            return
+        if self._nvml_disabled:
+            logger.info("NVML indisponível: monitoramento de GPUs não iniciado")
+            return
+            
         async def metrics_loop():
+            # Agenda pelo relógio do loop: a duração da coleta não acumula
+            # atraso entre os ticks
+            loop = asyncio.get_running_loop()
+            base_interval = self.config['monitoring']['metrics_interval']
+            backoff = base_interval
+            next_tick = loop.time()
             while True:
-                await self._update_metrics()
-                await asyncio.sleep(1)
+                started = time.perf_counter()
+                ok = await self._update_metrics()
+                elapsed = time.perf_counter() - started
+                
+                if ok:
+                    # Intervalo adaptativo: coleta lenta (driver carregado)
+                    # espaça os ticks para não sobrecarregar o NVML
+                    backoff = base_interval
+                    interval = max(base_interval, elapsed * self.MONITOR_OVERHEAD_FACTOR)
+                else:
+                    # Nenhuma GPU respondeu: recua exponencialmente antes de
+                    # sondar o driver de novo
+                    backoff = min(backoff * 2, self.MAX_MONITOR_BACKOFF)
+                    interval = backoff
+                    
+                next_tick += interval
+                delay = next_tick - loop.time()
+                if delay < 0:
+                    # Coleta mais lenta que o intervalo: pula os ticks perdidos
+                    next_tick = loop.time()
+                    delay = 0
+                await asyncio.sleep(delay)
                 
         async def health_loop():
             while True:
                 await self._check_gpu_health()
-                await asyncio.sleep(60)
                 
-        asyncio.create_task(metrics_loop())
-        asyncio.create_task(health_loop())
+        for name, loop_fn in (("metrics", metrics_loop), ("health", health_loop)):
+            task = asyncio.create_task(loop_fn(), name=f"gpu-{name}")
+            task.add_done_callback(self._log_monitor_exit)
+            self._monitor_tasks.append(task)
+            
+    async def stop_monitoring(self):
+        """Cancela os loops de monitoramento e aguarda seu término"""
+        tasks, self._monitor_tasks = self._monitor_tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
         
-    async def _update_metrics(self):
-        """Atualiza métricas de todas as GPUs"""
-        for gpu_id, handle in self.handles.items():
-            try:
-                # Métricas básicas
-                mem = pynvml.nvmlDeviceGetMemoryInfo(handle)
-                util = pynvml.nvmlDeviceGetUtilizationRates(handle)
-                temp = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
+    @staticmethod
+    def _log_monitor_exit(task: asyncio.Task):
+        """Registra o erro que encerrou um loop de monitoramento"""
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger.error(f"Loop de monitoramento {task.get_name()} encerrado: {exc}", exc_info=exc)
+        
+    async def _update_metrics(self) -> bool:
+        """
+        Atualiza métricas de todas as GPUs.
+        
+        Retorna False se nenhuma GPU respondeu ao NVML neste ciclo.
+        """
+        with_nvlink = self._metrics_tick % self.NVLINK_SAMPLE_TICKS == 0
+        self._metrics_tick += 1
+        
+        # Chamadas NVML bloqueiam: a coleta completa roda em uma thread
+        samples = await self._run_nvml(self._collect_all_nvml, with_nvlink)
+        
+        # A thread NVML só reporta o modo usado; a troca definitiva para os
+        # contadores por link é aplicada aqui, no event loop
+        if self._nvlink_batched and any(
+            not isinstance(sample, pynvml.NVMLError)
+            and sample[1] is not None
+            and not sample[1][1]
+            and self._nvlink_links[gpu_id]
+            for gpu_id, sample in samples.items()
+        ):
+            logger.warning("Field values NVLink indisponíveis, usando contadores por link")
+            self._nvlink_batched = False
+            self._last_nvlink.clear()
+            
+        failures = 0
+        for gpu_id, sample in samples.items():
+            gauges = self._gauges[gpu_id]
+            if isinstance(sample, pynvml.NVMLError):
+                logger.error(f"Erro ao atualizar métricas da GPU {gpu_id}: {sample}")
+                self._nvml_errors[gpu_id] += 1
+                gauges['errors'].inc()
+                failures += 1
+                continue
                 
-                self.metrics['vram_used'].labels(gpu_id).set(mem.used)
-                self.metrics['utilization'].labels(gpu_id).set(util.gpu)
-                self.metrics['temperature'].labels(gpu_id).set(temp)
-                self.metrics['task_count'].labels(gpu_id).set(len(self.gpus[gpu_id]['tasks']))
+            row, nvlink = sample
+            self._telemetry[gpu_id] = row
+            ts, _, mem_used, mem_free, cached_free, util, temp = row
+            self._device_free[gpu_id] = mem_free + cached_free
+            
+            # Métricas básicas
+            self._publish(gpu_id, 'memory', mem_used)
+            self._publish(gpu_id, 'utilization', util)
+            self._publish(gpu_id, 'temperature', temp)
+            self._publish(gpu_id, 'tasks', len(self.gpus[gpu_id]['tasks']))
+            
+            # Métricas NVLink: taxa desde a leitura anterior do mesmo modo
+            counters, batched = nvlink or ({}, False)
+            for peer_id, counter in counters.items():
+                key = (gpu_id, peer_id)
+                last = self._last_nvlink.get(key)
+                self._last_nvlink[key] = (counter, ts, batched)
+                if (
+                    last is not None and last[2] == batched
+                    and counter >= last[0] and ts > last[1]
+                ):
+                    gauges['nvlink'][peer_id].set((counter - last[0]) / (ts - last[1]))
                 
-                # Métricas NVLink
-                for peer_id in self.gpus[gpu_id]['nvlink_peers']:
-                    for link in range(pynvml.NVML_NVLINK_MAX_LINKS):
-                        try:
-                            if pynvml.nvmlDeviceGetNvLinkState(handle, link):
-                                speed = pynvml.nvmlDeviceGetNvLinkUtilizationCounter(handle, link, 0)
-                                self.metrics['nvlink_speed'].labels(gpu_id, peer_id).set(speed)
-                        except pynvml.NVMLError:
-                            continue
-                            
-            except pynvml.NVMLError as e:
-                logger.error(f"Erro ao atualizar métricas da GPU {gpu_id}: {e}")
-                self.metrics['errors'].labels(gpu_id).inc()
+        self._check_alerts()
+        return not samples or failures < len(samples)
                 
-    async def _check_gpu_health(self):
-        """Verifica saúde das GPUs e gerencia failover"""
-        for gpu_id, handle in self.handles.items():
-            if gpu_id in self.failed_gpus:
+    def _publish(self, gpu_id: int, name: str, value: float):
+        """Atualiza o gauge só quando o valor muda, poupando o lock interno"""
+        key = (gpu_id, name)
+        if self._last_published.get(key) != value:
+            self._last_published[key] = value
+            self._gauges[gpu_id][name].set(value)
+            
+    def _check_alerts(self):
+        """
+        Sinaliza para failover as GPUs acima do limite de temperatura ou de
+        erros NVML.
+        
+        As comparações são vetorizadas sobre a telemetria; só as GPUs em
+        alerta (caso raro) passam pelo laço em Python.
+        """
+        limit = self.config['monitoring']['temperature_limit']
+        alerts = np.flatnonzero(
+            (self._telemetry['temp'] > limit) | (self._nvml_errors > self.MAX_NVML_ERRORS)
+        )
+        for gpu_id in alerts.tolist():
+            if gpu_id in self.failed_gpus or gpu_id in self._unhealthy:
                 continue
-                
+            temp = int(self._telemetry['temp'][gpu_id])
+            errors = int(self._nvml_errors[gpu_id])
+            logger.error(f"GPU {gpu_id} falhou: temp={temp}°C, errors={errors}")
+            self._unhealthy.add(gpu_id)
+            self._unhealthy_event.set()
+            
+    def _collect_all_nvml(self, with_nvlink: bool = True) -> Dict[int, object]:
+        """
+        Coleta síncrona das leituras NVML de todas as GPUs monitoradas.
+        
+        Não altera o estado do gerenciador: cada GPU produz
+        (linha de telemetria, (contadores NVLink, batched) ou None) ou, em
+        caso de falha, a própria NVMLError. Os contadores NVLink só são lidos
+        quando with_nvlink é verdadeiro.
+        """
+        samples = {}
+        for gpu_id in self._gauges:
+            handle = self.handles[gpu_id]
             try:
-                temp = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
-                error_count = int(self.metrics['errors'].labels(gpu_id)._value.get())
+                row = self._query_gpu(gpu_id)
+                nvlink = self._read_nvlink_counters(gpu_id, handle) if with_nvlink else None
+                samples[gpu_id] = (row, nvlink)
+            except pynvml.NVMLError as e:
+                samples[gpu_id] = e
+        return samples
                 
-                if temp > self.config['monitoring']['temperature_limit'] or error_count > 10:
-                    logger.error(f"GPU {gpu_id} falhou: temp={temp}°C, errors={error_count}")
-                    await self._handle_gpu_failure(gpu_id)
-                    
+    def _read_nvlink_counters(self, gpu_id: int, handle) -> Optional[Tuple[Dict[int, int], bool]]:
+        """
+        Soma rx+tx dos links ativos de cada par NVLink.
+        
+        Apenas os links mapeados na inicialização são lidos; a topologia não
+        muda em execução. Retorna (contadores, batched) ou None se a leitura
+        em lote falhou de forma transitória. Se o binding ou o driver não
+        suportarem os campos de throughput, usa a leitura legada por link e
+        reporta batched=False; a troca de modo fica a cargo de _update_metrics.
+        """
+        links_by_peer = self._nvlink_links[gpu_id]
+        if self._nvlink_batched and links_by_peer:
+            try:
+                counters = self._read_nvlink_fields(
+                    handle, self._nvlink_field_ids[gpu_id], links_by_peer
+                )
+                return counters, True
+            except TypeError:
+                pass  # Binding sem suporte: cai na leitura por link
             except pynvml.NVMLError as e:
-                logger.error(f"Erro ao verificar saúde da GPU {gpu_id}: {e}")
-                self.metrics['errors'].labels(gpu_id).inc()
+                if getattr(e, 'value', None) not in self.NVLINK_FIELDS_UNSUPPORTED:
+                    return None  # Falha transitória: sem NVLink neste ciclo
+                    
+        counters = {}
+        for peer_id, links in links_by_peer.items():
+            total = 0
+            for link in links:
+                try:
+                    rx, tx = pynvml.nvmlDeviceGetNvLinkUtilizationCounter(handle, link, 0)
+                    total += rx + tx
+                except pynvml.NVMLError:
+                    continue
+            counters[peer_id] = total
+        return counters, False
+        
+    def _read_nvlink_fields(
+        self,
+        handle,
+        field_ids: List[Tuple[int, int]],
+        links_by_peer: Dict[int, List[int]]
+    ) -> Dict[int, int]:
+        """Lê o throughput (KiB) rx/tx de todos os links em uma única chamada NVML"""
+        values = pynvml.nvmlDeviceGetFieldValues(handle, field_ids)
+        if all(v.nvmlReturn != pynvml.NVML_SUCCESS for v in values):
+            raise pynvml.NVMLError(values[0].nvmlReturn)
+            
+        counters = {}
+        i = 0
+        for peer_id, links in links_by_peer.items():
+            total = 0
+            for v in values[i:i + 2 * len(links)]:
+                if v.nvmlReturn == pynvml.NVML_SUCCESS:
+                    total += v.value.ullVal
+            counters[peer_id] = total
+            i += 2 * len(links)
+        return counters
+        
+    def _query_gpu(self, gpu_id: int) -> Tuple:
+        """
+        Consulta memória, utilização e temperatura via NVML.
+        
+        Retorna uma linha na ordem dos campos de TELEMETRY_DTYPE; cached_free
+        é o cache ocioso do alocador do PyTorch (reservado - alocado).
+        """
+        handle = self.handles[gpu_id]
+        mem = self._get_memory_info(handle)
+        util = pynvml.nvmlDeviceGetUtilizationRates(handle)
+        temp = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
+        cached_free = torch.cuda.memory_reserved(gpu_id) - torch.cuda.memory_allocated(gpu_id)
+        return (time.monotonic(), mem.total, mem.used, mem.free, cached_free, util.gpu, temp)
+        
+    def _get_memory_info(self, handle):
+        """Lê a memória da GPU com a versão de struct escolhida em _init_nvml"""
+        if self._mem_version is None:
+            return pynvml.nvmlDeviceGetMemoryInfo(handle)
+        return pynvml.nvmlDeviceGetMemoryInfo(handle, version=self._mem_version)
+        
+    async def _run_nvml(self, func, *args):
+        """Executa chamadas NVML na thread dedicada, fora do event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._nvml_executor, func, *args)
+        
+    async def _read_gpu_state(self, gpu_id: int) -> np.void:
+        """Retorna a linha de telemetria, consultando o NVML apenas se estiver obsoleta"""
+        max_age = self.config['monitoring']['metrics_interval']
+        if time.monotonic() - self._telemetry['ts'][gpu_id] > max_age:
+            self._telemetry[gpu_id] = await self._run_nvml(self._query_gpu, gpu_id)
+        return self._telemetry[gpu_id]
+                
+    async def _check_gpu_health(self):
+        """Aguarda GPUs sinalizadas por _update_metrics e gerencia failover"""
+        await self._unhealthy_event.wait()
+        self._unhealthy_event.clear()
+        
+        unhealthy, self._unhealthy = self._unhealthy, set()
+        for gpu_id in unhealthy:
+            if gpu_id not in self.failed_gpus:
+                await self._handle_gpu_failure(gpu_id)
                 
     async def _handle_gpu_failure(self, gpu_id: int):
         """Gerencia falha de GPU e redistribui tarefas"""
-        async with self.lock:
+        async with self.global_lock:
+            # Decisão e mutação são síncronas: o lock nunca fica retido
+            # através de um await
             self.failed_gpus.add(gpu_id)
             
-            # Redistribui tarefas
-            tasks_to_move = self.gpus[gpu_id]['tasks'].copy()
-            for task_id in tasks_to_move:
+            for task_id in tuple(self.gpus[gpu_id]['tasks']):
                 task = self.tasks[task_id]
-                new_gpu_id = await self._find_replacement_gpu(task)
-                if new_gpu_id is not None:
-                    await self._move_task(task, new_gpu_id)
+                new_gpu = self._find_replacement_gpu(task)
+                if new_gpu is not None:
+                    self._move_task(task, new_gpu['id'])
                 else:
                     logger.error(f"Não foi possível realocar tarefa {task_id}")
                     
-    async def _move_task(self, task: GPUTask, new_gpu_id: int):
+    def _find_replacement_gpu(self, task: GPUTask) -> Optional[Dict]:
+        """GPU preferida, fora das falhas, que comporte a tarefa"""
+        return self._pop_gpu_for(task.vram_required)
+        
+    def _move_task(self, task: GPUTask, new_gpu_id: int):
         """Move uma tarefa para outra GPU"""
         old_gpu_id = task.gpu_id
         
         # Remove da GPU antiga
         self.gpus[old_gpu_id]['tasks'].remove(task.task_id)
         self.gpus[old_gpu_id]['used_memory'] -= task.vram_required
+        self._push_gpu(self.gpus[old_gpu_id])
         
         # Adiciona na nova GPU
-        self.gpus[new_gpu_id]['tasks'].append(task.task_id)
+        self.gpus[new_gpu_id]['tasks'].add(task.task_id)
         self.gpus[new_gpu_id]['used_memory'] += task.vram_required
+        self._push_gpu(self.gpus[new_gpu_id])
         task.gpu_id = new_gpu_id
         
         logger.info(f"Tarefa {task.task_id} movida da GPU {old_gpu_id} para {new_gpu_id}")
         
+    @staticmethod
+    def _pci_key(pci_info) -> Tuple[int, int, int]:
+        """Chave numérica do endereço PCI de uma struct nvmlPciInfo"""
+        return (pci_info.domain, pci_info.bus, pci_info.device)
+        
     def _get_nvlink_peers(self, gpu_id: int) -> List[int]:
-        """Retorna lista de GPUs conectadas via NVLink"""
-        peers = []
+        """
+        Retorna lista de GPUs conectadas via NVLink.
+        
+        Também registra em self._nvlink_links os links ativos de cada par,
+        usados pela coleta de métricas.
+        """
+        links: Dict[int, List[int]] = {}
         handle = self.handles[gpu_id]
         
         for link in range(pynvml.NVML_NVLINK_MAX_LINKS):
             try:
                 if pynvml.nvmlDeviceGetNvLinkState(handle, link):
                     peer_info = pynvml.nvmlDeviceGetNvLinkRemotePciInfo(handle, link)
-                    for i, h in self.handles.items():
-                        if i != gpu_id:
-                            pci_info = pynvml.nvmlDeviceGetPciInfo(h)
-                            if peer_info.busId == pci_info.busId:
-                                peers.append(i)
-                                break
+                    peer_id = self._bus_to_gpu.get(self._pci_key(peer_info))
+                    if peer_id is not None and peer_id != gpu_id:
+                        links.setdefault(peer_id, []).append(link)
             except pynvml.NVMLError:
                 continue
                 
-        return list(set(peers))
+        self._nvlink_links[gpu_id] = links
+        if self._nvlink_batched:
+            self._nvlink_field_ids[gpu_id] = [
+                (field, link)
+                for peer_links in links.values()
+                for link in peer_links
+                for field in (
+                    pynvml.NVML_FI_DEV_NVLINK_THROUGHPUT_DATA_RX,
+                    pynvml.NVML_FI_DEV_NVLINK_THROUGHPUT_DATA_TX
+                )
+            ]
+        return list(links)
         
     async def predict_vram_usage(self, task_type: str) -> float:
-        """Prediz uso de VRAM com base no tipo de tarefa e histórico"""
-        cache = await self.cache.get_cache('gpu')
-        cache_key = f"vram_estimate_{task_type}"
+        """
+        Prediz uso de VRAM com base no tipo de tarefa e na carga atual.
         
-        cached = await cache.get(cache_key)
-        if cached:
-            return float(cached)
-            
+        Calculado localmente a cada chamada: a estimativa custa menos que
+        uma ida ao cache e, guardada por tipo de tarefa, ficava presa à
+        carga do momento em que foi gravada.
+        """
         base_estimate = self.vram_map.get(task_type, 6.0)
         load_factor = 1 + (len(self.tasks) / len(self.gpus)) if self.gpus else 1
-        estimate = base_estimate * load_factor * 1024**3  # Converte para bytes
-        
-        await cache.set(cache_key, estimate, ttl=300)
-        return estimate
+        return base_estimate * load_factor * 1024**3  # Converte para bytes
         
     async def allocate_gpu(self, task_type: str, required_memory: int) -> int:
-        """Aloca GPU para uma tarefa"""
-        async with self.lock:
-            # Verificar memória total do sistema
-            system_memory = psutil.virtual_memory()
-            if system_memory.percent > 90:
-                raise InsufficientVRAMError(
-                    required_vram=required_memory,
-                    available_vram=0,
-                    message="Sistema sem memória disponível"
-                )
-            
-            # Limpar cache se necessário
-            if system_memory.percent > 75:
-                torch.cuda.empty_cache()
-                gc.collect()
-            
-            # Ordena GPUs por:
-            # 1. Número de conexões NVLink
-            # 2. Memória livre
-            # 3. Número de tarefas
-            sorted_gpus = sorted(
-                [g for g in self.gpus if g['id'] not in self.failed_gpus],
-                key=lambda g: (
-                    len(g['nvlink_peers']),
-                    g['total_memory'] - g['used_memory'],
-                    -len(g['tasks'])
-                ),
-                reverse=True
+        """
+        Aloca GPU para uma tarefa.
+        
+        Escolha e registro da GPU são síncronos, portanto atômicos no
+        event loop; só a preempção passa pelo global_lock.
+        """
+        # Verificar memória total do sistema
+        system_memory = psutil.virtual_memory()
+        if system_memory.percent > 90:
+            raise InsufficientVRAMError(
+                required_vram=required_memory,
+                available_vram=0
             )
-            
-            for gpu in sorted_gpus:
-                free_memory = gpu['total_memory'] - gpu['used_memory']
-                if free_memory >= required_memory:
-                    gpu['used_memory'] += required_memory
-                    task = GPUTask(
-                        task_id=task_type,
-                        gpu_id=gpu['id'],
-                        vram_required=required_memory,
-                        priority=0,
-                        start_time=time.time()
-                    )
-                    self.tasks[task_type] = task
-                    gpu['tasks'].append(task_type)
-                    logger.info(f"GPU {gpu['id']} alocada para tarefa {task_type}")
-                    return gpu['id']
-                    
-            # Se não encontrou GPU livre, tenta preempção
+        
+        # Limpar cache se necessário
+        if system_memory.percent > 75:
+            torch.cuda.empty_cache()
+            gc.collect()
+        
+        # GPU preferida (NVLink, memória livre, tarefas) que comporte a tarefa
+        gpu = self._pop_gpu_for(required_memory)
+        if gpu is not None:
+            self._assign_task(gpu, GPUTask(
+                task_id=task_type,
+                gpu_id=gpu['id'],
+                vram_required=required_memory,
+                priority=0,
+                start_time=time.monotonic()
+            ))
+            logger.info(f"GPU {gpu['id']} alocada para tarefa {task_type}")
+            return gpu['id']
+                
+        # Se não encontrou GPU livre, tenta preempção (envolve várias GPUs)
+        async with self.global_lock:
             return await self._try_preempt_gpu(required_memory, 0)
             
-    async def _calculate_preemption_score(self, task: GPUTask, gpu_id: int) -> float:
+    def _assign_task(self, gpu: Dict, task: GPUTask):
+        """Registra a tarefa na GPU; o chamador garante que ela cabe"""
+        gpu['used_memory'] += task.vram_required
+        gpu['tasks'].add(task.task_id)
+        self.tasks[task.task_id] = task
+        self._push_gpu(gpu)
+        
+    def _calculate_preemption_scores(self, tasks: List[GPUTask]) -> np.ndarray:
         """
-        Calcula o score de preempção para uma tarefa baseado em:
+        Calcula o score de preempção de cada tarefa baseado em:
         - Prioridade da tarefa
         - Tempo de execução
         - Uso de VRAM
         - Impacto no sistema
         
-        Retorna score normalizado (0-1), onde maior = melhor candidato para preempção
+        Retorna scores normalizados (0-1), onde maior = melhor candidato para preempção
         """
-        runtime = time.time() - task.start_time if task.start_time else 0
-        
         # Fatores de peso para cada componente
         PRIORITY_WEIGHT = 0.4
         RUNTIME_WEIGHT = 0.3
         VRAM_WEIGHT = 0.2
         IMPACT_WEIGHT = 0.1
         
+        now = time.monotonic()
+        priorities = np.fromiter((t.priority for t in tasks), float, len(tasks))
+        runtimes = np.fromiter(
+            (now - t.start_time if t.start_time else 0 for t in tasks), float, len(tasks)
+        )
+        vrams = np.fromiter((t.vram_required for t in tasks), float, len(tasks))
+        nvlink_counts = np.fromiter(
+            (len(self.gpus[t.gpu_id]['nvlink_peers']) for t in tasks), float, len(tasks)
+        )
+        
         # Normaliza prioridade (menor prioridade = maior score)
-        priority_score = 1 - (task.priority / 10)  # Assume prioridade máxima = 10
+        priority_score = 1 - priorities / 10  # Assume prioridade máxima = 10
         
         # Penaliza tarefas rodando há mais tempo
-        runtime_score = 1 / (1 + runtime/3600)  # Normaliza para 1 hora
+        runtime_score = 1 / (1 + runtimes / 3600)  # Normaliza para 1 hora
         
         # Favorece tarefas usando mais VRAM
-        vram_score = task.vram_required / (24 * 1024**3)  # Normaliza para 24GB
+        vram_score = vrams / (24 * 1024**3)  # Normaliza para 24GB
         
         # Avalia impacto do NVLink
-        nvlink_impact = len(self.gpus[gpu_id]['nvlink_peers']) / len(self.gpus)
+        nvlink_impact = nvlink_counts / len(self.gpus)
         
         return (
             PRIORITY_WEIGHT * priority_score +
@@ -362,40 +746,67 @@ class GPUManager:
         Encontra o melhor conjunto de tarefas para preempção considerando múltiplas GPUs.
         Implementa uma estratégia gulosa para minimizar o número de preempções.
         """
-        all_candidates: List[PreemptionCandidate] = []
-        
         # Coleta candidatos de todas as GPUs
+        tasks: List[GPUTask] = []
         for gpu in self.gpus:
             if gpu['id'] in self.failed_gpus:
                 continue
                 
             for task_id in gpu['tasks']:
                 task = self.tasks[task_id]
-                if task.priority >= priority:
-                    continue
+                if task.priority < priority:
+                    tasks.append(task)
                     
-                score = await self._calculate_preemption_score(task, gpu['id'])
-                candidate = PreemptionCandidate(task, gpu['id'], score)
-                all_candidates.append(candidate)
-                
-        if not all_candidates:
+        if not tasks:
             return None
             
-        # Ordena candidatos por score (maior primeiro)
-        all_candidates.sort(key=lambda c: c.score, reverse=True)
+        # Scores calculados de uma vez para todos os candidatos
+        scores = self._calculate_preemption_scores(tasks)
+        all_candidates = [
+            PreemptionCandidate(task, task.gpu_id, float(score))
+            for task, score in zip(tasks, scores)
+        ]
+            
+        # Se uma tarefa sozinha libera o necessário, basta a de maior score
+        single = [c for c in all_candidates if c.task.vram_required >= vram_required]
+        if single:
+            best = max(single, key=lambda c: c.score)
+            return PreemptionPlan([best], best.task.vram_required, {best.gpu_id})
+            
+        # Senão, seleção gulosa pelo peso score × VRAM liberada. Candidatos em
+        # GPUs já afetadas ganham bônus, para o plano tocar menos GPUs; ao
+        # afetar uma GPU, seus candidatos são reinseridos com o bônus e as
+        # entradas antigas passam a ser ignoradas
+        AFFECTED_BONUS = 2.0
+        
+        by_gpu: Dict[int, List[int]] = {}
+        heap = []
+        for i, c in enumerate(all_candidates):
+            by_gpu.setdefault(c.gpu_id, []).append(i)
+            heap.append((-c.score * c.task.vram_required, i, False))
+        heapq.heapify(heap)
         
-        # Encontra melhor combinação de candidatos
         selected_candidates = []
         total_vram = 0
         affected_gpus = set()
         
-        for candidate in all_candidates:
-            if total_vram >= vram_required:
-                break
+        while heap and total_vram < vram_required:
+            _, i, boosted = heapq.heappop(heap)
+            candidate = all_candidates[i]
+            if not boosted and candidate.gpu_id in affected_gpus:
+                continue  # Substituída pela entrada com bônus
                 
             selected_candidates.append(candidate)
             total_vram += candidate.task.vram_required
-            affected_gpus.add(candidate.gpu_id)
+            
+            if candidate.gpu_id not in affected_gpus:
+                affected_gpus.add(candidate.gpu_id)
+                for j in by_gpu[candidate.gpu_id]:
+                    if j != i:
+                        c = all_candidates[j]
+                        heapq.heappush(
+                            heap, (-c.score * c.task.vram_required * AFFECTED_BONUS, j, True)
+                        )
             
         if total_vram < vram_required:
             return None
@@ -410,31 +821,37 @@ class GPUManager:
         preempted_tasks = []
         
         try:
-            # Executa preempções
-            for candidate in plan.candidates:
-                await self.release_gpu(candidate.task.task_id)
-                preempted_tasks.append(candidate.task)
+            # Executa preempções: contabilidade de todas as tarefas de uma vez
+            preempted_tasks = self._release_tasks(c.task.task_id for c in plan.candidates)
+            now = time.monotonic()
+            for task in preempted_tasks:
                 logger.info(
-                    f"Preemptada tarefa {candidate.task.task_id} da GPU {candidate.gpu_id} "
-                    f"(prioridade={candidate.task.priority}, runtime={time.time()-candidate.task.start_time:.1f}s)"
+                    f"Preemptada tarefa {task.task_id} da GPU {task.gpu_id} "
+                    f"(prioridade={task.priority}, runtime={now-task.start_time:.1f}s)"
                 )
                 
-            # Escolhe a GPU com mais VRAM livre
-            best_gpu = max(
-                [g for g in self.gpus if g['id'] in plan.affected_gpus],
-                key=lambda g: g['total_memory'] - g['used_memory']
-            )
+            # Devolve ao driver os blocos das tarefas preemptadas de uma só
+            # vez; no fluxo normal o cache do alocador é mantido para reuso
+            torch.cuda.empty_cache()
+                
+            # Escolhe a GPU com mais VRAM livre em uma única passada
+            best_gpu = None
+            best_free = -1
+            for gpu_id in plan.affected_gpus:
+                gpu = self.gpus[gpu_id]
+                free_memory = gpu['total_memory'] - gpu['used_memory']
+                if free_memory > best_free:
+                    best_gpu, best_free = gpu, free_memory
             
             return True, best_gpu['id']
             
         except Exception as e:
             logger.error(f"Erro durante preempção: {str(e)}")
-            # Tenta restaurar tarefas preemptadas
+            # Restaura as tarefas preemptadas na GPU de origem. Não passa por
+            # allocate_gpu: ela poderia cair em nova preempção e tentar
+            # readquirir o global_lock que já está em posse deste plano
             for task in preempted_tasks:
-                try:
-                    await self.allocate_gpu(task.task_id, task.vram_required, task.priority)
-                except Exception as restore_error:
-                    logger.error(f"Erro ao restaurar tarefa {task.task_id}: {str(restore_error)}")
+                self._assign_task(self.gpus[task.gpu_id], task)
             return False, None
 
     async def _try_preempt_gpu(self, vram_required: int, priority: int) -> Optional[int]:
@@ -484,63 +901,96 @@ class GPUManager:
         
     async def release_gpu(self, task_id: str):
         """Libera GPU alocada para uma tarefa"""
-        async with self.lock:
-            if task_id in self.tasks:
-                task = self.tasks[task_id]
-                gpu = self.gpus[task.gpu_id]
+        # Sem lock: _release_tasks é síncrono e atômico no event loop
+        for task in self._release_tasks((task_id,)):
+            logger.info(f"GPU {task.gpu_id} liberada da tarefa {task_id}")
                 
-                gpu['used_memory'] -= task.vram_required
-                gpu['tasks'].remove(task_id)
-                del self.tasks[task_id]
+    def _release_tasks(self, task_ids: Iterable[str]) -> List[GPUTask]:
+        """
+        Remove as tarefas da contabilidade das GPUs e retorna as liberadas.
+        
+        Síncrono, portanto atômico no event loop; cada GPU afetada é
+        reinserida no heap uma única vez.
+        """
+        released = []
+        touched: Dict[int, Dict] = {}
+        for task_id in task_ids:
+            task = self.tasks.pop(task_id, None)
+            if task is None:
+                continue  # Já liberada
                 
-                logger.info(f"GPU {task.gpu_id} liberada da tarefa {task_id}")
-                torch.cuda.empty_cache()
+            gpu = self.gpus[task.gpu_id]
+            gpu['used_memory'] -= task.vram_required
+            gpu['tasks'].discard(task_id)
+            touched[task.gpu_id] = gpu
+            released.append(task)
+            
+        for gpu in touched.values():
+            self._push_gpu(gpu)
+        return released
                 
+    def telemetry_snapshot(self) -> List[Dict]:
+        """
+        Última telemetria já coletada de cada GPU, sem consultar o NVML.
+        Seguro para chamar de contextos síncronos como filtros de logging.
+        """
+        return [
+            {
+                'id': gpu_id,
+                'utilization': int(row['util']),
+                'memory': {
+                    'total': int(row['mem_total']),
+                    'used': int(row['mem_used'])
+                }
+            }
+            for gpu_id, row in enumerate(self._telemetry)
+            if np.isfinite(row['ts'])
+        ]
+        
     async def get_gpu_status(self) -> List[Dict]:
         """Retorna status detalhado de todas as GPUs"""
-        async with self.lock:
-            status = []
-            for gpu in self.gpus:
-                gpu_id = gpu['id']
-                handle = self.handles[gpu_id]
-                
-                try:
-                    info = pynvml.nvmlDeviceGetMemoryInfo(handle)
-                    util = pynvml.nvmlDeviceGetUtilizationRates(handle)
-                    temp = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
-                    
-                    status.append({
-                        'id': gpu_id,
-                        'failed': gpu_id in self.failed_gpus,
-                        'memory': {
-                            'total': info.total,
-                            'used': info.used,
-                            'free': info.free
-                        },
-                        'utilization': util.gpu,
-                        'temperature': temp,
-                        'nvlink_peers': gpu['nvlink_peers'],
-                        'active_tasks': len(gpu['tasks']),
-                        'tasks': [
-                            {
-                                'id': tid,
-                                'vram': self.tasks[tid].vram_required,
-                                'priority': self.tasks[tid].priority,
-                                'runtime': time.time() - self.tasks[tid].start_time
-                            }
-                            for tid in gpu['tasks']
-                        ]
-                    })
-                except pynvml.NVMLError as e:
-                    logger.error(f"Erro ao obter status da GPU {gpu_id}: {e}")
-                    status.append({
-                        'id': gpu_id,
-                        'failed': True,
-                        'error': str(e)
-                    })
-                    
-            return status
+        # Sem lock: a leitura NVML vem do cache alimentado por
+        # _update_metrics e só vai à thread NVML se estiver obsoleta
+        now = time.monotonic()
+        status = []
+        for gpu in self.gpus:
+            gpu_id = gpu['id']
             
+            try:
+                state = await self._read_gpu_state(gpu_id)
+                
+                status.append({
+                    'id': gpu_id,
+                    'failed': gpu_id in self.failed_gpus,
+                    'memory': {
+                        'total': int(state['mem_total']),
+                        'used': int(state['mem_used']),
+                        'free': int(state['mem_free'])
+                    },
+                    'utilization': int(state['util']),
+                    'temperature': int(state['temp']),
+                    'nvlink_peers': gpu['nvlink_peers'],
+                    'active_tasks': len(gpu['tasks']),
+                    'tasks': [
+                        {
+                            'id': tid,
+                            'vram': self.tasks[tid].vram_required,
+                            'priority': self.tasks[tid].priority,
+                            'runtime': now - self.tasks[tid].start_time
+                        }
+                        for tid in gpu['tasks']
+                    ]
+                })
+            except pynvml.NVMLError as e:
+                logger.error(f"Erro ao obter status da GPU {gpu_id}: {e}")
+                status.append({
+                    'id': gpu_id,
+                    'failed': True,
+                    'error': str(e)
+                })
+                
+        return status
+        
     def __del__(self):
         """Cleanup ao destruir o gerenciador"""
         try:
@@ -596,5 +1046,13 @@ async def validate_gpus():
         logger.error(f"Erro validando GPUs: {e}")
         raise
 
-# Instância global
-gpu_manager = GPUManager() 
\ No newline at end of file
+# Instância global, criada no primeiro uso: construir o gerenciador
+# inicializa o NVML, o que não deve acontecer no import do módulo
+_gpu_manager: Optional[GPUManager] = None
+
+def get_gpu_manager() -> GPUManager:
+    """Retorna o gerenciador global de GPUs, criando-o na primeira chamada"""
+    global _gpu_manager
+    if _gpu_manager is None:
+        _gpu_manager = GPUManager()
+    return _gpu_manager
@@ -1,12 +1,48 @@
 import asyncio
+import hashlib
 import logging
+import os
+from collections import OrderedDict
 from typing import Dict, Any, Optional
 import json
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+def _hash_workflow(workflow: Dict[str, Any]) -> str:
+    """
+    Digest estrutural do workflow, estável entre processos.
+    
+    Percorre o workflow uma vez alimentando o blake2b incrementalmente, sem
+    montar o JSON completo; as chaves de dicionário entram ordenadas.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    
+    def _walk(value):
+        if isinstance(value, dict):
+            h.update(b"{")
+            for key in sorted(value, key=str):
+                h.update(repr(key).encode())
+                h.update(b":")
+                _walk(value[key])
+            h.update(b"}")
+        elif isinstance(value, (list, tuple)):
+            h.update(b"[")
+            for item in value:
+                _walk(item)
+                h.update(b",")
+            h.update(b"]")
+        else:
+            h.update(repr(value).encode())
+            
+    _walk(workflow)
+    return h.hexdigest()
+
 class VRAMManager:
+    # Limite do cache de estimativas (LRU) e novas entradas entre gravações
+    MAX_ESTIMATES = 4096
+    FLUSH_EVERY = 32
+    
     def __init__(self):
         self.models = {
             "SDXL": {"vram": 8000, "loaded": False},
@@ -14,24 +50,42 @@ class VRAMManager:
             "ComfyUI": {"vram": 4000, "loaded": False}  # Reserva para ComfyUI
         }
         
-        # Cache de estimativas de VRAM por workflow
-        self.workflow_vram_estimates: Dict[str, int] = {}
+        # Cache LRU de estimativas de VRAM por workflow
+        self.workflow_vram_estimates: "OrderedDict[str, int]" = OrderedDict()
+        self._pending_flush = 0
+        
+        base_path = Path(__file__).parent.parent.parent
+        self._estimates_path = base_path / "config" / "vram_estimates.json"
         
         # Carregar estimativas de workflows conhecidos
         self._load_workflow_estimates()
     
     def _load_workflow_estimates(self):
         """Carrega estimativas de VRAM para workflows conhecidos"""
-        base_path = Path(__file__).parent.parent.parent
-        estimates_path = base_path / "config" / "vram_estimates.json"
-        
-        if estimates_path.exists():
+        if self._estimates_path.exists():
             try:
-                self.workflow_vram_estimates = json.loads(estimates_path.read_text())
+                self.workflow_vram_estimates = OrderedDict(
+                    json.loads(self._estimates_path.read_text())
+                )
+                while len(self.workflow_vram_estimates) > self.MAX_ESTIMATES:
+                    self.workflow_vram_estimates.popitem(last=False)
                 logger.info(f"Carregadas {len(self.workflow_vram_estimates)} estimativas de VRAM")
             except json.JSONDecodeError:
                 logger.error("Erro ao carregar estimativas de VRAM")
     
+    def _save_workflow_estimates(self):
+        """
+        Grava as estimativas em disco de forma atômica (arquivo temporário +
+        os.replace), para que um processo interrompido não deixe JSON truncado
+        """
+        tmp_path = self._estimates_path.with_suffix(".json.tmp")
+        try:
+            tmp_path.write_text(json.dumps(self.workflow_vram_estimates))
+            os.replace(tmp_path, self._estimates_path)
+            self._pending_flush = 0
+        except OSError as e:
+            logger.error(f"Erro ao salvar estimativas de VRAM: {e}")
+    
     async def load_model(self, model_name: str):
         """
         Carrega um modelo na VRAM.
@@ -72,12 +126,13 @@ class VRAMManager:
             Estimativa de VRAM em MB
         """
         # Calcular hash do workflow para cache
-        workflow_str = json.dumps(workflow, sort_keys=True)
-        workflow_hash = hash(workflow_str)
+        workflow_hash = _hash_workflow(workflow)
         
         # Verificar cache
-        if workflow_hash in self.workflow_vram_estimates:
-            return self.workflow_vram_estimates[workflow_hash]
+        cached = self.workflow_vram_estimates.get(workflow_hash)
+        if cached is not None:
+            self.workflow_vram_estimates.move_to_end(workflow_hash)
+            return cached
         
         # Estimativa básica baseada no número de nós
         base_vram = 4000  # VRAM base para ComfyUI
@@ -85,32 +140,75 @@ class VRAMManager:
         
         total_vram = base_vram + (len(workflow) * vram_per_node)
         
-        # Adicionar ao cache
+        # Adicionar ao cache, descartando a entrada menos usada
         self.workflow_vram_estimates[workflow_hash] = total_vram
+        if len(self.workflow_vram_estimates) > self.MAX_ESTIMATES:
+            self.workflow_vram_estimates.popitem(last=False)
+        
+        self._pending_flush += 1
+        if self._pending_flush >= self.FLUSH_EVERY:
+            self._save_workflow_estimates()
         
         return total_vram
 
-class VRAMBalancer:
-    def __init__(self, gpu_manager):
+class VRAMOptimizer:
+    """
+    Otimiza o uso de VRAM em um único loop: rebalanceia a carga entre GPUs
+    (quando há gerenciador de GPUs) e concilia os workloads rastreados com
+    os modelos carregados.
+    """
+    
+    def __init__(self, gpu_manager=None, vram_manager: Optional[VRAMManager] = None):
         self.gpu_manager = gpu_manager
-        self.vram_manager = VRAMManager()
+        self.vram_manager = vram_manager or VRAMManager()
+        self.workload_tracker = {
+            "comfyui": {},  # Tracking de workflows ComfyUI
+            "models": {}    # Tracking de outros modelos
+        }
     
     async def optimize_allocations(self):
-        """Balanceia carga de VRAM entre GPUs"""
+        """Otimiza alocações de VRAM"""
         while True:
-            gpu_status = await self.gpu_manager.get_status()
-            
-            # Calcular desbalanceamento
-            usage = [g['used_vram'] for g in gpu_status.values()]
-            avg = sum(usage) / len(usage)
-            
-            # Redistribuir tarefas
-            for gpu_id, usage in gpu_status.items():
-                if usage > avg * 1.2:  # 20% acima da média
-                    await self.rebalance_gpu(gpu_id)
+            try:
+                await self.optimize_once()
+            except Exception as e:
+                # Uma falha pontual não deve encerrar o loop
+                logger.error(f"Erro otimizando alocações de VRAM: {e}")
             
             await asyncio.sleep(30)
     
+    async def optimize_once(self):
+        """Executa uma iteração do loop de otimização"""
+        if self.gpu_manager is not None:
+            await self._rebalance_gpus()
+        await self._reconcile_workloads()
+    
+    async def _rebalance_gpus(self):
+        """Balanceia carga de VRAM entre GPUs"""
+        gpu_status = await self.gpu_manager.get_gpu_status()
+        
+        # VRAM em uso por GPU saudável
+        usage = {
+            gpu['id']: self._used_vram(gpu)
+            for gpu in gpu_status
+            if not gpu.get('failed')
+        }
+        if not usage:
+            return
+        avg = sum(usage.values()) / len(usage)
+        
+        # Redistribuir tarefas
+        for gpu_id, used in usage.items():
+            if used > avg * 1.2:  # 20% acima da média
+                await self.rebalance_gpu(gpu_id)
+    
+    @staticmethod
+    def _used_vram(gpu: Dict[str, Any]) -> int:
+        """VRAM em uso no status de qualquer um dos gerenciadores de GPU"""
+        if 'used_memory' in gpu:
+            return gpu['used_memory']
+        return gpu.get('memory', {}).get('used', 0)
+    
     async def rebalance_gpu(self, gpu_id: str):
         """
         Rebalanceia carga de uma GPU específica.
@@ -120,37 +218,36 @@ class VRAMBalancer:
         """
         logger.info(f"Rebalanceando GPU {gpu_id}")
         # Implementar lógica de rebalanceamento
-
-class VRAMOptimizer:
-    def __init__(self):
-        self.vram_manager = VRAMManager()
-        self.workload_tracker = {
-            "comfyui": {},  # Tracking de workflows ComfyUI
-            "models": {}    # Tracking de outros modelos
-        }
     
-    async def optimize_allocations(self):
-        """Otimiza alocações de VRAM"""
-        while True:
-            # Otimizar alocações ComfyUI
-            if self.workload_tracker["comfyui"]:
-                for workflow_id, workflow in self.workload_tracker["comfyui"].items():
-                    vram_needed = await self.vram_manager.estimate_workflow_vram(workflow)
-                    logger.info(f"Workflow {workflow_id} requer {vram_needed}MB VRAM")
-                    
-                    # Garantir VRAM suficiente
-                    if vram_needed > self.get_available_vram():
-                        await self.vram_manager.unload_least_used_model()
+    async def _reconcile_workloads(self):
+        """Garante VRAM para os workflows rastreados e carrega os modelos pendentes"""
+        # Otimizar alocações ComfyUI
+        if self.workload_tracker["comfyui"]:
+            total_needed = 0
+            for workflow_id, workflow in self.workload_tracker["comfyui"].items():
+                vram_needed = await self.vram_manager.estimate_workflow_vram(workflow)
+                logger.info(f"Workflow {workflow_id} requer {vram_needed}MB VRAM")
+                total_needed += vram_needed
             
-            # Otimizar alocações de modelos
-            for model_name in self.workload_tracker["models"]:
-                if not self.vram_manager.models[model_name]["loaded"]:
-                    try:
-                        await self.vram_manager.load_model(model_name)
-                    except ValueError as e:
-                        logger.warning(f"Erro ao carregar modelo: {str(e)}")
-            
-            await asyncio.sleep(30)
+            # Garantir VRAM suficiente para todos os workflows de uma vez
+            while total_needed > self.get_available_vram() and self._has_unloadable_model():
+                await self.vram_manager.unload_least_used_model()
+        
+        # Otimizar alocações de modelos
+        for model_name in self.workload_tracker["models"]:
+            if not self.vram_manager.models[model_name]["loaded"]:
+                try:
+                    await self.vram_manager.load_model(model_name)
+                except ValueError as e:
+                    logger.warning(f"Erro ao carregar modelo: {str(e)}")
+    
+    def _has_unloadable_model(self) -> bool:
+        """Indica se ainda há modelo carregado que pode ser descarregado"""
+        return any(
+            model["loaded"]
+            for name, model in self.vram_manager.models.items()
+            if name != "ComfyUI"
+        )
     
     def get_available_vram(self) -> int:
         """
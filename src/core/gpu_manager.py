@@ -6,19 +6,20 @@ Controla alocação, monitoramento e liberação de recursos GPU.
 import torch
 import logging
 import asyncio
-from typing import Optional, Dict, List
+import heapq
+import itertools
+import time
+from typing import Optional, Dict, List, Tuple
 from dataclasses import dataclass
 from src.core.config import settings
+from src.core.gpu.manager import NVML_EXECUTOR
 import pynvml
-from prometheus_client import Gauge, CollectorRegistry, REGISTRY
-from src.core.cache import Cache
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
 import psutil
 
 logger = logging.getLogger(__name__)
 
-# Criar um registro dedicado para métricas GPU
-GPU_REGISTRY = CollectorRegistry()
-
 @dataclass
 class GPUTask:
     """Representa uma tarefa usando GPU"""
@@ -33,6 +34,19 @@ class GPUManager:
     
     _instance = None
     
+    # Idade máxima da telemetria NVML (utilização/temperatura) em segundos
+    TELEMETRY_TTL = 1.0
+    
+    # Palavras-chave de class_type -> tipo de workflow, em ordem de precedência
+    _WORKFLOW_KEYWORDS = (
+        ('video', 'video'),
+        ('audio', 'audio'),
+        ('upscale', 'upscale'),
+        ('inpaint', 'inpainting'),
+        ('img2img', 'img2img'),
+        ('txt2img', 'txt2img')
+    )
+    
     def __new__(cls):
         """Implementa singleton para evitar múltiplas instâncias"""
         if cls._instance is None:
@@ -42,18 +56,39 @@ class GPUManager:
     def __init__(self):
         """Inicializa o gerenciador de GPUs"""
         if not hasattr(self, 'initialized'):
-            self.registry = GPU_REGISTRY
-            self.gpus = []
+            # Enumeradas no primeiro acesso a self.gpus (ver a property)
+            self._gpus: Optional[List[Dict]] = None
             self.tasks: Dict[str, GPUTask] = {}
-            self.lock = asyncio.Lock()
-            self._initialize_gpus()
-            self._init_metrics()
+            # Status publicado após cada mutação; lido sem lock
+            self._snapshot: Tuple[Dict, ...] = ()
+            # ID da GPU -> posição em self.gpus
+            self._gpu_index: Dict[int, int] = {}
+            # Posições das GPUs ordenadas por número de pares NVLink (fixo)
+            self._nvlink_rank: Optional[List[int]] = None
+            
+            # Heap de GPUs por memória livre (-livre, índice, versão) com
+            # remoção preguiçosa: cada mutação incrementa a versão da GPU
+            self._free_heap: List[Tuple[int, int, int]] = []
+            self._gpu_versions: Dict[int, int] = {}
+            
+            # Sequência das tarefas: entradas (prioridade, seq, task_id) dos
+            # heaps por GPU só valem enquanto a seq da tarefa for a mesma
+            self._task_seq: Dict[str, int] = {}
+            self._seq = itertools.count()
+            
+            # Última leitura NVML de todas as GPUs, renovada pelo poller
+            # iniciado no lifespan: {gpu_id: (utilização %, temperatura °C)}
+            self._telemetry: Dict[int, Tuple[int, int]] = {}
+            self._telemetry_ts = float('-inf')
+            self._telemetry_refresh: Optional[asyncio.Future] = None
+            self._telemetry_task: Optional[asyncio.Task] = None
+            
+            REGISTRY.register(GPUCollector(self))
             self.vram_map = {
                 'sdxl': 8.5,
                 'fish_speech': 4.2,
                 'video': 12.0
             }
-            self.cache = Cache()
             self.initialized = True
             
             # Add default VRAM requirements for different workflow types
@@ -66,7 +101,21 @@ class GPUManager:
                 'audio': 4.2 * 1024**3,  # 4.2GB
             }
         
+    @property
+    def gpus(self) -> List[Dict]:
+        """
+        GPUs gerenciadas.
+        
+        A enumeração cria o contexto CUDA (get_device_properties), então é
+        adiada até o primeiro uso: processos que importam o módulo sem
+        alocar GPU não pagam a inicialização nem a VRAM do contexto.
+        """
+        if self._gpus is None:
+            self._initialize_gpus()
+        return self._gpus
+        
     def _initialize_gpus(self):
+        self._gpus = []
         try:
             if torch.cuda.is_available():
                 for gpu_id in range(torch.cuda.device_count()):
@@ -74,62 +123,77 @@ class GPUManager:
                     self.gpus.append({
                         "id": gpu_id,
                         "total_memory": total_memory,
-                        "used_memory": 0
+                        "used_memory": 0,
+                        "free_memory": total_memory,
+                        "tasks": set(),
+                        "task_heap": []
                     })
                     logger.info(f"GPU {gpu_id} inicializada: {total_memory/1024**3:.1f}GB")
             else:
                 logger.warning("CUDA não disponível. Usando CPU.")
+                total_memory = psutil.virtual_memory().total
                 self.gpus.append({
                     "id": -1,
-                    "total_memory": psutil.virtual_memory().total,
+                    "total_memory": total_memory,
                     "used_memory": 0,
+                    "free_memory": total_memory,
+                    "tasks": set(),
+                    "task_heap": [],
                     "is_cpu": True
                 })
         except Exception as e:
             logger.error(f"Erro inicializando GPUs: {e}")
             
-    def _init_metrics(self):
-        """Inicializa métricas Prometheus"""
+        for idx, gpu in enumerate(self.gpus):
+            self._gpu_index[gpu["id"]] = idx
+            self._push_gpu(idx)
+        self._init_nvml()
+        self._refresh_snapshot()
+        
+    def _init_nvml(self):
+        """
+        Inicializa o NVML uma única vez, guardando o handle de cada GPU e o
+        índice PCI bus ID -> GPU usado na descoberta de pares NVLink
+        """
+        self._bus_to_gpu: Dict[str, int] = {}
         try:
-            metric_prefix = settings.GPU_METRICS_PREFIX
-            
-            # Usar prefixos únicos para cada métrica
-            self.metrics = {
-                'utilization': Gauge(
-                    f'{metric_prefix}_utilization',
-                    'Utilização da GPU',
-                    ['gpu_id'],
-                    registry=self.registry
-                ),
-                'memory_used': Gauge(
-                    f'{metric_prefix}_memory_used',
-                    'Memória utilizada da GPU (MB)',
-                    ['gpu_id'],
-                    registry=self.registry
-                ),
-                'temperature': Gauge(
-                    f'{metric_prefix}_temperature',
-                    'Temperatura da GPU (°C)',
-                    ['gpu_id'],
-                    registry=self.registry
-                ),
-                'power_usage': Gauge(
-                    f'{metric_prefix}_power_usage',
-                    'Consumo de energia da GPU (W)',
-                    ['gpu_id'],
-                    registry=self.registry
-                ),
-                'memory_total': Gauge(
-                    f'{metric_prefix}_memory_total',
-                    'Memória total da GPU (MB)',
-                    ['gpu_id'],
-                    registry=self.registry
-                )
-            }
-        except Exception as e:
-            logger.error(f"Erro ao inicializar métricas: {e}")
-            raise
-
+            pynvml.nvmlInit()
+            for gpu in self.gpus:
+                if gpu.get("is_cpu"):
+                    continue
+                handle = pynvml.nvmlDeviceGetHandleByIndex(gpu["id"])
+                gpu["nvml_handle"] = handle
+                self._bus_to_gpu[pynvml.nvmlDeviceGetPciInfo(handle).busId] = gpu["id"]
+        except pynvml.NVMLError as e:
+            logger.warning(f"NVML indisponível, topologia NVLink desabilitada: {e}")
+            
+    def _push_gpu(self, idx: int):
+        """Registra a memória livre atual da GPU (posição em self.gpus) no heap"""
+        gpu = self.gpus[idx]
+        version = self._gpu_versions.get(idx, 0) + 1
+        self._gpu_versions[idx] = version
+        heapq.heappush(
+            self._free_heap,
+            (-gpu["free_memory"], idx, version)
+        )
+        
+        # Compacta o heap quando as entradas obsoletas dominam
+        if len(self._free_heap) > 4 * len(self.gpus):
+            self._free_heap = [
+                e for e in self._free_heap if e[2] == self._gpu_versions[e[1]]
+            ]
+            heapq.heapify(self._free_heap)
+            
+    def _best_gpu_for(self, vram_required: int) -> Optional[int]:
+        """Retorna a posição da GPU com mais memória livre, se ela comportar a tarefa"""
+        while self._free_heap:
+            neg_free, idx, version = self._free_heap[0]
+            if version != self._gpu_versions[idx]:
+                heapq.heappop(self._free_heap)  # Entrada obsoleta
+                continue
+            return idx if -neg_free >= vram_required else None
+        return None
+            
     async def allocate_gpu(self, task_id: str, vram_required: int, priority: int = 0) -> Optional[int]:
         """
         Aloca uma GPU para uma tarefa.
@@ -142,57 +206,76 @@ class GPUManager:
         Returns:
             ID da GPU alocada ou None se não houver GPU disponível
         """
-        async with self.lock:
-            if not self.gpus:
+        # Sem lock: do início ao fim não há await, então a mutação é
+        # atômica em relação às demais corrotinas do event loop
+        if not self.gpus:
+            return None
+            
+        # GPU com mais memória livre, se comportar a tarefa
+        idx = self._best_gpu_for(vram_required)
+        
+        # Se não encontrou GPU livre, tentar liberar tarefas de menor prioridade
+        if idx is None:
+            idx = self._try_preempt_gpu(vram_required, priority)
+            if idx is None:
                 return None
                 
-            # Encontrar GPU com memória suficiente
-            for gpu in self.gpus:
-                free_memory = gpu["total_memory"] - gpu["used_memory"]
-                if free_memory >= vram_required:
-                    gpu["used_memory"] += vram_required
-                    task = GPUTask(
-                        task_id=task_id,
-                        gpu_id=gpu["id"],
-                        vram_required=vram_required,
-                        priority=priority
-                    )
-                    self.tasks[task_id] = task
-                    gpu["tasks"].append(task_id)
-                    logger.info(f"GPU {gpu['id']} alocada para tarefa {task_id}")
-                    return gpu["id"]
-                    
-            # Se não encontrou GPU livre, tentar liberar tarefas de menor prioridade
-            return await self._try_preempt_gpu(vram_required, priority)
+        return self._assign(idx, task_id, vram_required, priority)
+        
+    def _assign(self, idx: int, task_id: str, vram_required: int, priority: int) -> int:
+        """Registra a tarefa na GPU da posição idx e retorna o ID da GPU"""
+        gpu = self.gpus[idx]
+        gpu["used_memory"] += vram_required
+        gpu["free_memory"] -= vram_required
+        self.tasks[task_id] = GPUTask(
+            task_id=task_id,
+            gpu_id=gpu["id"],
+            vram_required=vram_required,
+            priority=priority
+        )
+        gpu["tasks"].add(task_id)
+        
+        seq = next(self._seq)
+        self._task_seq[task_id] = seq
+        heapq.heappush(gpu["task_heap"], (priority, seq, task_id))
+        self._push_gpu(idx)
+        self._refresh_snapshot()
+        
+        logger.info(f"GPU {gpu['id']} alocada para tarefa {task_id}")
+        return gpu["id"]
     
-    async def _try_preempt_gpu(self, vram_required: int, priority: int) -> Optional[int]:
-        """Tenta liberar GPU preemptando tarefas de menor prioridade"""
-        for gpu in self.gpus:
-            preemptable_tasks = [
-                self.tasks[t] for t in gpu["tasks"]
-                if self.tasks[t].priority < priority
-            ]
-            
-            if not preemptable_tasks:
-                continue
-                
-            # Ordenar por prioridade (menor primeiro)
-            preemptable_tasks.sort(key=lambda t: t.priority)
-            
-            freed_memory = 0
-            tasks_to_remove = []
+    def _try_preempt_gpu(self, vram_required: int, priority: int) -> Optional[int]:
+        """
+        Tenta liberar GPU preemptando tarefas de menor prioridade.
+        
+        Síncrono, dentro da mutação de allocate_gpu. Em cada GPU retira do heap de
+        tarefas apenas as vítimas necessárias (menor prioridade primeiro);
+        se não bastarem, as entradas retiradas voltam ao heap.
+        """
+        for idx, gpu in enumerate(self.gpus):
+            task_heap = gpu["task_heap"]
+            available = gpu["free_memory"]
+            victims = []
             
-            for task in preemptable_tasks:
-                freed_memory += task.vram_required
-                tasks_to_remove.append(task.task_id)
-                if freed_memory >= vram_required:
+            while task_heap and available < vram_required:
+                task_priority, seq, task_id = task_heap[0]
+                if self._task_seq.get(task_id) != seq:
+                    heapq.heappop(task_heap)  # Tarefa já liberada
+                    continue
+                if task_priority >= priority:
                     break
-                    
-            if freed_memory >= vram_required:
+                victims.append(heapq.heappop(task_heap))
+                available += self.tasks[task_id].vram_required
+                
+            if available >= vram_required:
                 # Remover tarefas preemptadas
-                for task_id in tasks_to_remove:
-                    await self.release_gpu(task_id)
-                return gpu["id"]
+                for _, _, task_id in victims:
+                    self._release_task(task_id)
+                    logger.info(f"Tarefa {task_id} preemptada na GPU {gpu['id']}")
+                return idx
+                
+            for entry in victims:
+                heapq.heappush(task_heap, entry)
                 
         return None
     
@@ -203,19 +286,38 @@ class GPUManager:
         Args:
             task_id: ID da tarefa
         """
-        async with self.lock:
-            if task_id not in self.tasks:
-                return
-                
-            task = self.tasks[task_id]
-            for gpu in self.gpus:
-                if gpu["id"] == task.gpu_id:
-                    gpu["used_memory"] -= task.vram_required
-                    gpu["tasks"].remove(task_id)
-                    break
-                    
-            del self.tasks[task_id]
-            logger.info(f"GPU {task.gpu_id} liberada da tarefa {task_id}")
+        if self._release_task(task_id):
+            self._refresh_snapshot()
+            
+    def _release_task(self, task_id: str) -> bool:
+        """
+        Remove a tarefa da contabilidade (síncrono, sem pontos de await).
+        
+        Retorna False se a tarefa não estava alocada.
+        """
+        try:
+            task = self.tasks.pop(task_id)
+        except KeyError:
+            return False
+            
+        # A entrada no heap de tarefas fica obsoleta
+        del self._task_seq[task_id]
+        idx = self._gpu_index[task.gpu_id]
+        gpu = self.gpus[idx]
+        gpu["used_memory"] -= task.vram_required
+        gpu["free_memory"] += task.vram_required
+        gpu["tasks"].discard(task_id)
+        
+        # Compacta o heap de tarefas quando as obsoletas dominam
+        if len(gpu["task_heap"]) > 2 * len(gpu["tasks"]) + 8:
+            gpu["task_heap"] = [
+                e for e in gpu["task_heap"] if self._task_seq.get(e[2]) == e[1]
+            ]
+            heapq.heapify(gpu["task_heap"])
+            
+        self._push_gpu(idx)
+        logger.info(f"GPU {task.gpu_id} liberada da tarefa {task_id}")
+        return True
             
     async def get_gpu_status(self) -> List[Dict]:
         """
@@ -224,37 +326,38 @@ class GPUManager:
         Returns:
             Lista com informações de cada GPU
         """
-        async with self.lock:
-            status = []
-            for gpu in self.gpus:
-                status.append({
-                    "id": gpu["id"],
-                    "total_memory": gpu["total_memory"],
-                    "used_memory": gpu["used_memory"],
-                    "free_memory": gpu["total_memory"] - gpu["used_memory"],
-                    "utilization": gpu["used_memory"] / gpu["total_memory"] * 100,
-                    "active_tasks": len(gpu["tasks"])
-                })
-            return status
+        if self._gpus is None:
+            self._initialize_gpus()
+        return list(self._snapshot)
+        
+    def _refresh_snapshot(self):
+        """Publica o status das GPUs; chamado ao fim de cada mutação"""
+        self._snapshot = tuple(
+            {
+                "id": gpu["id"],
+                "total_memory": gpu["total_memory"],
+                "used_memory": gpu["used_memory"],
+                "free_memory": gpu["free_memory"],
+                "utilization": gpu["used_memory"] / gpu["total_memory"] * 100,
+                "active_tasks": len(gpu["tasks"])
+            }
+            for gpu in self.gpus
+        )
 
     async def _predict_vram_usage(self, model_type: str) -> float:
-        """Preve o uso de VRAM com base no modelo e histórico"""
-        # Consulta cache de estimativas
-        cache_key = f"vram_estimate_{model_type}"
-        cached = await self.cache.get(cache_key)
-        if cached:
-            return float(cached)
+        """
+        Preve o uso de VRAM com base no modelo e na carga atual.
         
+        Calculado localmente a cada chamada: são poucas operações
+        aritméticas, mais baratas que a ida ao cache externo, e a estimativa
+        acompanha a carga atual em vez da carga do momento em que foi gravada.
+        """
         # Calcula estimativa dinâmica
         base_estimate = self.vram_map.get(model_type, 6.0)
         
         # Ajuste baseado na carga atual
         load_factor = 1 + (len(self.tasks) / len(self.gpus)) if self.gpus else 1
-        estimate = base_estimate * load_factor * 1024**3  # Convert to bytes
-        
-        # Atualiza cache
-        await self.cache.set(cache_key, estimate, ttl=300)
-        return estimate
+        return base_estimate * load_factor * 1024**3  # Convert to bytes
 
     async def check_nvlink_peers(self, gpu_id: int) -> List[int]:
         """
@@ -266,34 +369,102 @@ class GPUManager:
         Returns:
             Lista de IDs das GPUs conectadas via NVLink
         """
+        idx = self._gpu_index.get(gpu_id)
+        if idx is None:
+            return []
+        gpu = self.gpus[idx]
+        
+        # A topologia não muda durante o processo: consulta o driver uma vez
+        if "nvlink_peers" in gpu:
+            return list(gpu["nvlink_peers"])
+            
+        handle = gpu.get("nvml_handle")
+        if handle is None:
+            return []
+            
         peers = []
-        try:
-            handle = pynvml.nvmlDeviceGetHandleByIndex(gpu_id)
-            
-            # Verifica cada link NVLink possível
-            for link in range(6):
-                try:
-                    # Verifica se o link está ativo
-                    if pynvml.nvmlDeviceGetNvLinkState(handle, link) == pynvml.NVML_FEATURE_ENABLED:
-                        # Obtém informações do peer conectado
-                        peer_info = pynvml.nvmlDeviceGetNvLinkRemotePciInfo(handle, link)
-                        
-                        # Encontra o ID da GPU correspondente ao PCI info
-                        for i in range(pynvml.nvmlDeviceGetCount()):
-                            peer_handle = pynvml.nvmlDeviceGetHandleByIndex(i)
-                            if pynvml.nvmlDeviceGetPciInfo(peer_handle).busId == peer_info.busId:
-                                if i not in peers and i != gpu_id:
-                                    peers.append(i)
-                                break
-                except pynvml.NVMLError as e:
-                    logger.debug(f"Link {link} não disponível para GPU {gpu_id}: {e}")
-                    continue
+        # Verifica cada link NVLink possível
+        for link in range(6):
+            try:
+                # Verifica se o link está ativo
+                if pynvml.nvmlDeviceGetNvLinkState(handle, link) == pynvml.NVML_FEATURE_ENABLED:
+                    # Obtém informações do peer conectado
+                    peer_info = pynvml.nvmlDeviceGetNvLinkRemotePciInfo(handle, link)
+                    
+                    # Encontra o ID da GPU correspondente ao PCI info
+                    i = self._bus_to_gpu.get(peer_info.busId)
+                    if i is not None and i not in peers and i != gpu_id:
+                        peers.append(i)
+            except pynvml.NVMLError as e:
+                logger.debug(f"Link {link} não disponível para GPU {gpu_id}: {e}")
+                continue
                 
-        except pynvml.NVMLError as e:
-            logger.error(f"Erro ao verificar peers NVLink para GPU {gpu_id}: {e}")
-            return []
+        gpu["nvlink_peers"] = peers
+        return list(peers)
+
+    def start_telemetry(self):
+        """Inicia o poller de telemetria; chamado no startup da aplicação"""
+        if self._telemetry_task is None or self._telemetry_task.done():
+            self._telemetry_task = asyncio.get_running_loop().create_task(
+                self._telemetry_loop()
+            )
+            
+    async def stop_telemetry(self):
+        """Cancela o poller de telemetria e aguarda seu término"""
+        task, self._telemetry_task = self._telemetry_task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            
+    async def _telemetry_loop(self):
+        """Renova a telemetria de todas as GPUs a cada TELEMETRY_TTL"""
+        while True:
+            await self._refresh_telemetry()
+            await asyncio.sleep(self.TELEMETRY_TTL)
+            
+    async def _refresh_telemetry(self):
+        """
+        Relê utilização e temperatura de todas as GPUs em uma passada na
+        thread NVML, no máximo uma vez por TELEMETRY_TTL; chamadas
+        concorrentes aguardam a mesma leitura
+        """
+        if time.monotonic() - self._telemetry_ts < self.TELEMETRY_TTL:
+            return
+            
+        refresh = self._telemetry_refresh
+        if refresh is not None:
+            await refresh
+            return
+            
+        gpus = self.gpus  # Enumera no event loop, não na thread
+        refresh = asyncio.get_running_loop().run_in_executor(NVML_EXECUTOR, self._read_telemetry, gpus)
+        self._telemetry_refresh = refresh
+        try:
+            self._telemetry = await refresh
+            self._telemetry_ts = time.monotonic()
+        finally:
+            self._telemetry_refresh = None
+            
+    def _read_telemetry(self, gpus: List[Dict]) -> Dict[int, Tuple[int, int]]:
+        """Leitura NVML síncrona de utilização e temperatura de cada GPU"""
+        telemetry = {}
+        for gpu in gpus:
+            handle = gpu.get("nvml_handle")
+            if handle is None:
+                continue
+            try:
+                telemetry[gpu["id"]] = (
+                    pynvml.nvmlDeviceGetUtilizationRates(handle).gpu,
+                    pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
+                )
+            except pynvml.NVMLError as e:
+                logger.debug(f"Telemetria indisponível para GPU {gpu['id']}: {e}")
+        return telemetry
         
-        return peers
+    async def get_temperature(self, gpu_id: int) -> int:
+        """Temperatura da GPU em °C pela telemetria em cache (0 se indisponível)"""
+        await self._refresh_telemetry()
+        return self._telemetry.get(gpu_id, (0, 0))[1]
 
     async def estimate_resources(self, workflow: dict) -> dict:
         """
@@ -344,22 +515,20 @@ class GPUManager:
 
     def _identify_workflow_type(self, workflow: dict) -> str:
         """Identifica o tipo do workflow baseado nos nós presentes"""
-        nodes = workflow.get('nodes', [])
-        node_types = {node.get('class_type', '').lower() for node in nodes}
-        
-        if any('video' in nt for nt in node_types):
-            return 'video'
-        elif any('audio' in nt for nt in node_types):
-            return 'audio'
-        elif any('upscale' in nt for nt in node_types):
-            return 'upscale'
-        elif any('inpaint' in nt for nt in node_types):
-            return 'inpainting'
-        elif any('img2img' in nt for nt in node_types):
-            return 'img2img'
-        elif any('txt2img' in nt for nt in node_types):
-            return 'txt2img'
-        return 'unknown'
+        # Passada única pelos nós: cada class_type só é comparado com as
+        # palavras-chave de precedência maior que a melhor já encontrada
+        keywords = self._WORKFLOW_KEYWORDS
+        best = len(keywords)
+        for node in workflow.get('nodes', []):
+            class_type = node.get('class_type', '').lower()
+            for rank in range(best):
+                if keywords[rank][0] in class_type:
+                    best = rank
+                    break
+            if best == 0:
+                break
+                
+        return keywords[best][1] if best < len(keywords) else 'unknown'
 
     async def allocate_gpu_for_task(self, task: 'GenerationTask') -> int:
         """
@@ -368,12 +537,20 @@ class GPUManager:
         """
         required_vram = await self._predict_vram_usage(task.model_type)
         
-        # Prioriza GPUs com NVLink
-        for gpu in sorted(self.gpus, 
-                         key=lambda x: len(self.check_nvlink_peers(x['id'])), 
-                         reverse=True):
-            if gpu['total_memory'] - gpu['used_memory'] >= required_vram:
-                return gpu['id']
+        # Prioriza GPUs com NVLink; a topologia é fixa, então a ordem é
+        # calculada uma única vez
+        if self._nvlink_rank is None:
+            peer_counts = [
+                len(await self.check_nvlink_peers(gpu['id'])) for gpu in self.gpus
+            ]
+            self._nvlink_rank = sorted(
+                range(len(self.gpus)), key=peer_counts.__getitem__, reverse=True
+            )
+            
+        for idx in self._nvlink_rank:
+            gpu = self.gpus[idx]
+            if gpu['free_memory'] >= required_vram:
+                return self._assign(idx, task.id, required_vram, task.priority)
                 
         return await self.allocate_gpu(
             task_id=task.id,
@@ -386,5 +563,60 @@ class GPUManager:
             return -1  # CPU
         return self.gpus[0]["id"]  # Simplificado para uso pessoal
 
+class GPUCollector:
+    """
+    Exporta a contabilidade de VRAM do GPUManager no momento do scrape.
+    
+    Lê apenas o snapshot publicado pelo gerenciador, então alocação e
+    liberação nunca tocam o prometheus_client.
+    """
+    
+    def __init__(self, manager: GPUManager):
+        self.manager = manager
+        
+    def collect(self):
+        prefix = settings.GPU_METRICS_PREFIX
+        allocated = GaugeMetricFamily(
+            f'{prefix}_allocated_vram_bytes',
+            'VRAM reservada pelas tarefas na GPU (bytes)',
+            labels=['gpu_id']
+        )
+        total = GaugeMetricFamily(
+            f'{prefix}_total_vram_bytes',
+            'VRAM total da GPU (bytes)',
+            labels=['gpu_id']
+        )
+        tasks = GaugeMetricFamily(
+            f'{prefix}_active_tasks',
+            'Tarefas alocadas na GPU',
+            labels=['gpu_id']
+        )
+        utilization = GaugeMetricFamily(
+            f'{prefix}_sampled_utilization_percent',
+            'Utilização da GPU na última leitura NVML (%)',
+            labels=['gpu_id']
+        )
+        temperature = GaugeMetricFamily(
+            f'{prefix}_sampled_temperature_celsius',
+            'Temperatura da GPU na última leitura NVML (°C)',
+            labels=['gpu_id']
+        )
+        for gpu in self.manager._snapshot:
+            gpu_id = str(gpu["id"])
+            allocated.add_metric([gpu_id], gpu["used_memory"])
+            total.add_metric([gpu_id], gpu["total_memory"])
+            tasks.add_metric([gpu_id], gpu["active_tasks"])
+            
+        # Só a telemetria já coletada pelo poller; nenhuma chamada NVML no scrape
+        for gpu_id, (util, temp) in self.manager._telemetry.items():
+            utilization.add_metric([str(gpu_id)], util)
+            temperature.add_metric([str(gpu_id)], temp)
+            
+        yield allocated
+        yield total
+        yield tasks
+        yield utilization
+        yield temperature
+
 # Instância global do gerenciador
 gpu_manager = GPUManager() 
\ No newline at end of file
@@ -3,28 +3,114 @@ Motor de processamento de imagem com suporte a operações básicas e avançadas
 """
 
 import logging
-from typing import Dict, List, Optional, Tuple, Any, Union
+import functools
+from typing import Callable, Dict, List, Optional, Tuple, Any, Union
+import anyio
 import numpy as np
 import torch
 import cv2
 from PIL import Image, ImageEnhance, ImageFilter
 import io
 import os
+import threading
+
+from src.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 class ImageEngine:
     """
     Motor de processamento de imagem com suporte a operações básicas e avançadas.
+    
+    As operações são síncronas (PIL/OpenCV); código assíncrono deve executá-las
+    via run() para não bloquear o event loop.
     """
     
+    # Modos PIL de 8 bits que o blur do OpenCV processa diretamente
+    CV_BLUR_MODES = ("L", "LA", "RGB", "RGBA")
+    # Maior kernel aceito por cv2.cuda.createGaussianFilter
+    CUDA_MAX_KSIZE = 32
+    
     def __init__(self):
         """Inicializa o motor de imagem."""
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         if self.device.type == "cuda":
             cv2.cuda.setDevice(0)
+        # Blur na GPU só se o OpenCV foi compilado com CUDA
+        self._cuda_blur = (
+            self.device.type == "cuda"
+            and cv2.cuda.getCudaEnabledDeviceCount() > 0
+        )
+        # Filtros CUDA não são thread-safe e run() usa várias threads: cada
+        # thread mantém seu próprio cache {(canais, k, radius): filtro}
+        self._cuda_local = threading.local()
+        # Criado no primeiro run(), pois exige um event loop ativo
+        self._limiter: Optional[anyio.CapacityLimiter] = None
+        
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Executa uma operação do motor numa thread de trabalho.
+        
+        Args:
+            fn: Operação síncrona (ex: image_engine.resize_image)
+            *args, **kwargs: Argumentos da operação
+            
+        Returns:
+            Resultado da operação
+        """
+        if self._limiter is None:
+            self._limiter = anyio.CapacityLimiter(settings.MAX_THREADS)
+        return await anyio.to_thread.run_sync(
+            functools.partial(fn, *args, **kwargs),
+            limiter=self._limiter
+        )
+        
+    def process_image(
+        self,
+        image: Image.Image,
+        operations: List[Dict[str, Any]],
+        output_format: str = "PIL"
+    ) -> Union[Image.Image, np.ndarray]:
+        """
+        Aplica uma sequência de operações à imagem.
+        
+        Args:
+            image: Imagem de entrada
+            operations: Operações no formato {"type": ..., "params": {...}}
+            output_format: "PIL" para Image, qualquer outro para array numpy
             
-    async def load_image(
+        Returns:
+            Imagem processada
+        """
+        for op in operations:
+            op_type = op["type"]
+            params = dict(op.get("params") or {})
+            
+            if op_type == "resize":
+                image = self.resize_image(
+                    image,
+                    (params["width"], params["height"]),
+                    keep_aspect=params.get("keep_aspect", False)
+                )
+            elif op_type == "crop":
+                image = self.crop_image(image, tuple(params["box"]))
+            elif op_type == "rotate":
+                image = self.rotate_image(
+                    image,
+                    params["angle"],
+                    expand=params.get("expand", True)
+                )
+            elif op_type in ("filter", "effect"):
+                filter_type = params.pop("filter", None) or params.pop("type")
+                image = self.apply_filter(image, filter_type, **params)
+            else:
+                raise ValueError(f"Operação desconhecida: {op_type}")
+                
+        if output_format == "PIL":
+            return image
+        return np.asarray(image)
+            
+    def load_image(
         self,
         source: Union[str, bytes, Image.Image],
         mode: str = "RGB"
@@ -57,7 +143,7 @@ class ImageEngine:
             logger.error(f"Erro carregando imagem: {e}")
             raise
             
-    async def save_image(
+    def save_image(
         self,
         image: Image.Image,
         output: Union[str, io.BytesIO],
@@ -86,7 +172,7 @@ class ImageEngine:
             logger.error(f"Erro salvando imagem: {e}")
             raise
             
-    async def resize_image(
+    def resize_image(
         self,
         image: Image.Image,
         size: Tuple[int, int],
@@ -115,7 +201,7 @@ class ImageEngine:
             logger.error(f"Erro redimensionando imagem: {e}")
             raise
             
-    async def crop_image(
+    def crop_image(
         self,
         image: Image.Image,
         box: Tuple[int, int, int, int]
@@ -136,7 +222,7 @@ class ImageEngine:
             logger.error(f"Erro recortando imagem: {e}")
             raise
             
-    async def rotate_image(
+    def rotate_image(
         self,
         image: Image.Image,
         angle: float,
@@ -159,7 +245,7 @@ class ImageEngine:
             logger.error(f"Erro rotacionando imagem: {e}")
             raise
             
-    async def apply_filter(
+    def apply_filter(
         self,
         image: Image.Image,
         filter_type: str,
@@ -179,7 +265,11 @@ class ImageEngine:
         try:
             if filter_type == "blur":
                 radius = params.get("radius", 2)
-                return image.filter(ImageFilter.GaussianBlur(radius))
+                if image.mode not in self.CV_BLUR_MODES or radius <= 0:
+                    return image.filter(ImageFilter.GaussianBlur(radius))
+                return Image.fromarray(
+                    self._gaussian_blur(np.asarray(image), radius)
+                )
             elif filter_type == "sharpen":
                 return image.filter(ImageFilter.SHARPEN)
             elif filter_type == "edge_enhance":
@@ -198,7 +288,44 @@ class ImageEngine:
             logger.error(f"Erro aplicando filtro: {e}")
             raise
             
-    async def detect_objects(
+    def _gaussian_blur(self, arr: np.ndarray, radius: float) -> np.ndarray:
+        """
+        Blur gaussiano com OpenCV (CUDA quando disponível).
+        
+        Args:
+            arr: Imagem 8 bits (H, W) ou (H, W, C)
+            radius: Desvio padrão do kernel, como no ImageFilter.GaussianBlur
+            
+        Returns:
+            Array borrado com o mesmo formato
+        """
+        k = 2 * int(3 * radius) + 1
+        channels = 1 if arr.ndim == 2 else arr.shape[2]
+        
+        # Os filtros CUDA só aceitam 8UC1 e 8UC4 e kernels de até 32
+        if self._cuda_blur and channels in (1, 4) and k <= self.CUDA_MAX_KSIZE:
+            filters = getattr(self._cuda_local, "filters", None)
+            if filters is None:
+                filters = self._cuda_local.filters = {}
+            key = (channels, k, radius)
+            gaussian = filters.get(key)
+            if gaussian is None:
+                mat_type = cv2.CV_8UC1 if channels == 1 else cv2.CV_8UC4
+                gaussian = cv2.cuda.createGaussianFilter(
+                    mat_type, mat_type, (k, k), radius,
+                    borderMode=cv2.BORDER_REPLICATE
+                )
+                filters[key] = gaussian
+            gpu_mat = cv2.cuda_GpuMat()
+            gpu_mat.upload(arr)
+            return gaussian.apply(gpu_mat).download()
+            
+        return cv2.GaussianBlur(
+            arr, (k, k), radius,
+            borderType=cv2.BORDER_REPLICATE
+        )
+            
+    def detect_objects(
         self,
         image: Image.Image,
         min_confidence: float = 0.5
@@ -228,7 +355,7 @@ class ImageEngine:
             logger.error(f"Erro detectando objetos: {e}")
             raise
             
-    async def composite_images(
+    def composite_images(
         self,
         base_image: Image.Image,
         overlay: Image.Image,
@@ -7,7 +7,7 @@ import logging.config
 from typing import Dict, Any
 from prometheus_client import Counter
 
-from src.core.gpu.manager import gpu_manager
+from src.core.gpu import manager as gpu_manager_module
 
 # Métricas
 LOG_COUNTS = Counter('log_count_total', 'Total de logs por nível', ['level'])
@@ -15,10 +15,13 @@ LOG_COUNTS = Counter('log_count_total', 'Total de logs por nível', ['level'])
 class GPULogFilter(logging.Filter):
     """Adiciona estatísticas de GPU aos logs"""
     def filter(self, record):
+        # Nunca cria o gerenciador: a inicialização dele também loga e
+        # reentraria neste filtro
+        manager = gpu_manager_module._gpu_manager
         try:
-            record.gpu_stats = gpu_manager.get_status()
-        except:
-            record.gpu_stats = {}
+            record.gpu_stats = manager.telemetry_snapshot() if manager else []
+        except Exception:
+            record.gpu_stats = []
         return True
 
 class MetricsHandler(logging.Handler):
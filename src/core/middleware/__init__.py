@@ -2,5 +2,6 @@
 Middlewares da aplicação
 """
 from .connection import ConnectionMiddleware
+from .request_id import RequestIDMiddleware, request_id_var
 
-__all__ = ['ConnectionMiddleware']
\ No newline at end of file
+__all__ = ['ConnectionMiddleware', 'RequestIDMiddleware', 'request_id_var']
\ No newline at end of file
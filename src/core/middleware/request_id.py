@@ -0,0 +1,26 @@
+"""
+Middleware de identificação de requisições
+"""
+from contextvars import ContextVar
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+import uuid
+
+# ID da requisição corrente; lido pelos handlers de erro sem passar pelo request.state
+request_id_var: ContextVar[str] = ContextVar("request_id", default="")
+
+class RequestIDMiddleware(BaseHTTPMiddleware):
+    """
+    Atribui um ID a cada requisição (reaproveitando o X-Request-ID do cliente)
+    e o devolve no cabeçalho da resposta
+    """
+    header_name = "X-Request-ID"
+
+    async def dispatch(self, request: Request, call_next):
+        request_id = request.headers.get(self.header_name) or uuid.uuid4().hex
+        request_id_var.set(request_id)
+        request.state.request_id = request_id
+
+        response = await call_next(request)
+        response.headers[self.header_name] = request_id
+        return response
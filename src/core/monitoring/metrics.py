@@ -44,6 +44,16 @@ GPU_METRICS = {
         'Consumo de energia da GPU em watts',
         ['device']
     ),
+    'tasks': Gauge(
+        'api_gpu_tasks',
+        'Tarefas ativas na GPU',
+        ['device']
+    ),
+    'nvlink': Gauge(
+        'api_gpu_nvlink_throughput',
+        'Taxa de utilização NVLink com a GPU par (unidades do contador por segundo)',
+        ['device', 'peer']
+    ),
     'errors': Counter(
         'api_gpu_errors',
         'Erros da GPU',
@@ -1,27 +1,47 @@
 import asyncio
+import heapq
+import itertools
 import os
 import signal
 
 class PriorityQueue:
+    # Capacidade por nível, na ordem de atendimento
+    MAXSIZE = {
+        "realtime": 10,
+        "high": 100,
+        "normal": 1000,
+        "low": 5000
+    }
+    
     def __init__(self):
-        self.queues = {
-            "realtime": asyncio.Queue(maxsize=10),
-            "high": asyncio.Queue(maxsize=100),
-            "normal": asyncio.Queue(maxsize=1000),
-            "low": asyncio.Queue(maxsize=5000)
-        }
+        # Heap única de (nível, sequência, prioridade, tarefa): ordem global
+        # estrita por prioridade e FIFO dentro do mesmo nível
+        self._rank = {name: rank for rank, name in enumerate(self.MAXSIZE)}
+        self._heap = []
+        self._seq = itertools.count()
+        self._sizes = dict.fromkeys(self.MAXSIZE, 0)
+        self._cond = asyncio.Condition()
     
     async def add_task(self, task, priority="normal"):
-        if priority not in self.queues:
-            raise InvalidPriorityError()
+        if priority not in self.MAXSIZE:
+            raise ValueError(f"Prioridade inválida: {priority}")
         
-        await self.queues[priority].put(task)
+        async with self._cond:
+            # Bloqueia enquanto o nível estiver cheio, como o asyncio.Queue limitado
+            await self._cond.wait_for(
+                lambda: self._sizes[priority] < self.MAXSIZE[priority]
+            )
+            heapq.heappush(self._heap, (self._rank[priority], next(self._seq), priority, task))
+            self._sizes[priority] += 1
     
     async def get_next_task(self):
-        for queue in ["realtime", "high", "normal", "low"]:
-            if not self.queues[queue].empty():
-                return await self.queues[queue].get()
-        return None 
+        async with self._cond:
+            if not self._heap:
+                return None
+            _, _, priority, task = heapq.heappop(self._heap)
+            self._sizes[priority] -= 1
+            self._cond.notify_all()
+            return task
 
     async def preempt_task(self, gpu_id: int):
         """Interrompe tarefa de menor prioridade na GPU"""
@@ -11,7 +11,7 @@ import torch
 import numpy as np
 from dataclasses import dataclass
 from prometheus_client import Gauge, Counter, Histogram
-from src.core.gpu.manager import gpu_manager
+from src.core.gpu.manager import get_gpu_manager
 from src.core.cache.manager import cache_manager
 
 logger = logging.getLogger(__name__)
@@ -136,7 +136,7 @@ class ResourceManager:
     
     async def get_resource_status(self) -> Dict[str, Any]:
         """Retorna status atual dos recursos."""
-        gpus = await gpu_manager.get_available_gpus()
+        gpus = await get_gpu_manager().get_available_gpus()
         
         status = {
             "gpus": [
@@ -172,7 +172,7 @@ class ResourceManager:
         preferred_gpu: Optional[int] = None
     ) -> List[int]:
         """Seleciona GPUs apropriadas para a tarefa."""
-        gpus = await gpu_manager.get_available_gpus()
+        gpus = await get_gpu_manager().get_available_gpus()
         
         if preferred_gpu is not None:
             # Tentar usar GPU preferida
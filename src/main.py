@@ -6,7 +6,7 @@ Gerencia inicialização, configuração e ciclo de vida da aplicação.
 from fastapi import FastAPI, Request
 import asyncio
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, UJSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.security import OAuth2PasswordBearer
 from contextlib import asynccontextmanager
 import logging
@@ -14,6 +14,7 @@ import time
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.middleware.sessions import SessionMiddleware
+from prometheus_client import make_asgi_app
 import psutil
 import torch
 from datetime import datetime
@@ -31,6 +32,9 @@ from src.core.initialization import initialize_api
 from src.services.image import get_image_service
 from src.services.video import get_video_service
 from src.core.middleware.timeout import TimeoutMiddleware
+from src.core.middleware.request_id import RequestIDMiddleware
+from src.core.gpu_manager import gpu_manager
+from src.core.gpu.manager import get_gpu_manager
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -53,11 +57,11 @@ sys.path.append(str(root_dir))
 async def lifespan(app: FastAPI):
     """Gerenciamento otimizado do ciclo de vida"""
     # Startup
+    gpu_monitor = None
     try:
         # Inicializar recursos em paralelo
         init_tasks = {
             'Redis Pool': init_redis_pool(),
-            'Monitoring': setup_monitoring(),
             'Directories': init_directories()
         }
         
@@ -81,6 +85,12 @@ async def lifespan(app: FastAPI):
                 logger.warning(f"Tentativa {attempt + 1} de iniciar scheduler falhou: {e}")
                 await asyncio.sleep(1)
         
+        # Telemetria NVML das GPUs (utilização/temperatura)
+        gpu_manager.start_telemetry()
+        # Métricas, alertas e failover do gerenciador unificado
+        gpu_monitor = get_gpu_manager()
+        gpu_monitor.start_monitoring()
+        
         logger.info("✅ API iniciada com sucesso")
         yield
         
@@ -89,6 +99,10 @@ async def lifespan(app: FastAPI):
         raise
     finally:
         # Shutdown limpo
+        await gpu_manager.stop_telemetry()
+        if gpu_monitor is not None:
+            await gpu_monitor.stop_monitoring()
+        
         shutdown_tasks = {
             'Scheduler': scheduler.shutdown(),
             'Redis Pool': close_redis_pool()
@@ -130,7 +144,7 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc",
     lifespan=lifespan,
-    default_response_class=UJSONResponse
+    default_response_class=ORJSONResponse
 )
 
 # Middlewares básicos
@@ -149,6 +163,7 @@ app.add_middleware(
     https_only=True   # Cookies apenas via HTTPS
 )
 app.add_middleware(TimeoutMiddleware, timeout=300)
+app.add_middleware(RequestIDMiddleware)
 
 # Middleware de rate limit
 @app.middleware("http")
@@ -196,6 +211,9 @@ from src.api.v2.endpoints import router_groups
 for router, tags in router_groups:
     app.include_router(router, prefix="/api/v2", tags=tags)
 
+# Métricas Prometheus servidas pelo próprio uvicorn, sem servidor HTTP extra
+app.mount("/metrics", make_asgi_app())
+
 # Dependency para injetar o ComfyServer
 async def get_comfy():
     return await get_comfy_server()
@@ -218,8 +236,7 @@ async def startup():
             'System Check': check_system(),
             'Database Check': check_db_connection(),
             'Redis Check': check_redis_connection(),
-            'Redis Pool': init_redis_pool(),
-            'Monitoring': setup_monitoring()
+            'Redis Pool': init_redis_pool()
         }
         
         results = await asyncio.gather(*init_tasks.values(), return_exceptions=True)
@@ -11,7 +11,7 @@ import uuid
 from src.core.config import settings
 from src.core.cache import cache
 from src.comfy.workflow_manager import ComfyWorkflowManager
-from src.core.gpu.manager import gpu_manager
+from src.core.gpu.manager import get_gpu_manager
 
 logger = logging.getLogger(__name__)
 
@@ -8,7 +8,7 @@ from typing import Dict, Any, List, Optional
 from pathlib import Path
 import json
 import torch
-from src.core.gpu.manager import gpu_manager
+from src.core.gpu.manager import get_gpu_manager
 from src.core.cache.manager import cache_manager
 
 logger = logging.getLogger(__name__)
@@ -89,7 +89,7 @@ class WorkflowOptimizer:
     
     async def _select_best_gpu(self, required_vram: float) -> int:
         """Seleciona a melhor GPU disponível."""
-        gpus = await gpu_manager.get_available_gpus()
+        gpus = await get_gpu_manager().get_available_gpus()
         
         best_gpu = None
         best_score = float("-inf")
@@ -119,7 +119,7 @@ class WorkflowOptimizer:
         vram_usage: float
     ) -> Dict[str, Any]:
         """Aplica otimizações ao workflow."""
-        gpu = await gpu_manager.get_gpu(gpu_id)
+        gpu = await get_gpu_manager().get_gpu(gpu_id)
         
         # Ajustar batch size se necessário
         if vram_usage > gpu.total_vram * self.vram_threshold:
@@ -0,0 +1,39 @@
+"""
+Testes para a configuração dos engines do banco de dados.
+"""
+
+import importlib
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy.pool import QueuePool
+
+# Adicionar diretório src ao PYTHONPATH
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.core.config import settings
+
+
+class TestDatabaseEngines(unittest.TestCase):
+    def test_production_engines_are_distinct(self):
+        """Engine síncrono e assíncrono não devem se sobrescrever"""
+        import src.core.db.database as database
+        # Recarrega com o ambiente original para não vazar os engines de
+        # produção para os demais testes
+        self.addCleanup(importlib.reload, database)
+        with patch.object(settings, "ENVIRONMENT", "production"):
+            database = importlib.reload(database)
+
+        self.assertIsNot(database.engine, database.async_engine)
+        self.assertIsInstance(database.engine.pool, QueuePool)
+        self.assertTrue(
+            str(database.async_engine.url).startswith("postgresql+asyncpg")
+        )
+        self.assertIs(database.SessionLocal.kw["bind"], database.engine)
+        self.assertIs(database.AsyncSessionLocal.kw["bind"], database.async_engine)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+"""
+Testes para a contabilidade de alocação e preempção do GPUManager unificado.
+"""
+
+import asyncio
+import sys
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+# Adicionar diretório src ao PYTHONPATH
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.core.gpu.manager import (
+    GPUManager,
+    GPUTask,
+    PreemptionCandidate,
+    PreemptionPlan,
+)
+
+GB = 1024 ** 3
+
+
+def make_manager(*totals):
+    """GPUManager sem NVML, com GPUs de memória total dada (GB)"""
+    manager = GPUManager.__new__(GPUManager)
+    manager.gpus = []
+    manager.tasks = {}
+    manager.failed_gpus = set()
+    manager.global_lock = asyncio.Lock()
+    manager._device_free = {}
+    manager._gpu_heap = []
+    manager._gpu_versions = {}
+    for gpu_id, total in enumerate(totals):
+        manager.gpus.append({
+            "id": gpu_id,
+            "total_memory": total * GB,
+            "used_memory": 0,
+            "tasks": set(),
+            "nvlink_peers": []
+        })
+    for gpu in manager.gpus:
+        manager._push_gpu(gpu)
+    return manager
+
+
+def live_entries(manager, gpu_id):
+    """Entradas do heap ainda válidas para a GPU"""
+    return [
+        e for e in manager._gpu_heap
+        if e[3] == gpu_id and e[4] == manager._gpu_versions[gpu_id]
+    ]
+
+
+class TestGPUAllocationHeap(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        memory = patch(
+            "src.core.gpu.manager.psutil.virtual_memory",
+            return_value=MagicMock(percent=10)
+        )
+        memory.start()
+        self.addCleanup(memory.stop)
+
+    async def test_allocate_uses_current_free_memory(self):
+        """Após cada mutação vale a nova versão da GPU, não a entrada antiga"""
+        manager = make_manager(16, 8)
+
+        self.assertEqual(await manager.allocate_gpu("a", 10 * GB), 0)
+        # GPU 0 ficou com 6GB livres; a entrada antiga (16GB) está obsoleta
+        self.assertEqual(await manager.allocate_gpu("b", 6 * GB), 1)
+        self.assertEqual(await manager.allocate_gpu("c", 5 * GB), 0)
+
+        self.assertEqual(manager.gpus[0]["used_memory"], 15 * GB)
+        self.assertEqual(manager.gpus[0]["tasks"], {"a", "c"})
+        for gpu in manager.gpus:
+            self.assertEqual(len(live_entries(manager, gpu["id"])), 1)
+
+    async def test_release_returns_memory_to_heap(self):
+        """release_gpu devolve a VRAM e a GPU volta a ser candidata"""
+        manager = make_manager(16, 8)
+        await manager.allocate_gpu("a", 12 * GB)
+        self.assertIsNone(manager._pop_gpu_for(12 * GB))
+
+        await manager.release_gpu("a")
+        await manager.release_gpu("a")  # Liberação repetida é ignorada
+
+        self.assertEqual(manager.gpus[0]["used_memory"], 0)
+        self.assertEqual(manager.gpus[0]["tasks"], set())
+        self.assertNotIn("a", manager.tasks)
+        self.assertIs(manager._pop_gpu_for(12 * GB), manager.gpus[0])
+
+    async def test_heap_is_compacted(self):
+        """Entradas obsoletas não se acumulam em ciclos de alocação"""
+        manager = make_manager(16, 8)
+        for i in range(100):
+            await manager.allocate_gpu(f"t{i}", GB)
+            await manager.release_gpu(f"t{i}")
+
+        self.assertLessEqual(len(manager._gpu_heap), 4 * len(manager.gpus) + 1)
+
+    async def test_failed_gpu_is_skipped(self):
+        """GPUs em falha não são escolhidas mesmo com mais memória livre"""
+        manager = make_manager(16, 8)
+        manager.failed_gpus.add(0)
+
+        self.assertEqual(await manager.allocate_gpu("a", 4 * GB), 1)
+
+
+class TestPreemptionPlan(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.manager = make_manager(16, 16)
+        for task in (
+            GPUTask("low-0", 0, 6 * GB, priority=0, start_time=time.monotonic()),
+            GPUTask("low-1", 1, 10 * GB, priority=0, start_time=time.monotonic()),
+        ):
+            self.manager._assign_task(self.manager.gpus[task.gpu_id], task)
+        self.plan = PreemptionPlan(
+            [
+                PreemptionCandidate(self.manager.tasks["low-0"], 0, 1.0),
+                PreemptionCandidate(self.manager.tasks["low-1"], 1, 1.0),
+            ],
+            16 * GB,
+            {0, 1}
+        )
+
+    async def test_execute_frees_tasks_and_picks_freest_gpu(self):
+        """O plano libera as tarefas e indica a GPU com mais VRAM livre"""
+        with patch("src.core.gpu.manager.torch.cuda.empty_cache"):
+            ok, gpu_id = await self.manager._execute_preemption_plan(self.plan)
+
+        self.assertTrue(ok)
+        self.assertEqual(gpu_id, 0)
+        self.assertEqual(self.manager.tasks, {})
+        for gpu in self.manager.gpus:
+            self.assertEqual(gpu["used_memory"], 0)
+            self.assertEqual(gpu["tasks"], set())
+
+    async def test_execute_rolls_back_on_failure(self):
+        """Falha no meio do plano restaura as tarefas nas GPUs de origem"""
+        with patch(
+            "src.core.gpu.manager.torch.cuda.empty_cache",
+            side_effect=RuntimeError("cuda")
+        ):
+            ok, gpu_id = await self.manager._execute_preemption_plan(self.plan)
+
+        self.assertFalse(ok)
+        self.assertIsNone(gpu_id)
+        self.assertEqual(set(self.manager.tasks), {"low-0", "low-1"})
+        self.assertEqual(self.manager.gpus[0]["used_memory"], 6 * GB)
+        self.assertEqual(self.manager.gpus[1]["used_memory"], 10 * GB)
+        self.assertEqual(self.manager.gpus[0]["tasks"], {"low-0"})
+        self.assertEqual(self.manager.gpus[1]["tasks"], {"low-1"})
+        # O heap reflete o estado restaurado
+        self.assertIsNone(self.manager._pop_gpu_for(11 * GB))
+        self.assertIs(self.manager._pop_gpu_for(10 * GB), self.manager.gpus[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
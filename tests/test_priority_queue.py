@@ -0,0 +1,65 @@
+"""
+Testes para a fila de prioridades de tarefas.
+"""
+
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+# Adicionar diretório src ao PYTHONPATH
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.core.queue.priority_manager import PriorityQueue
+
+
+class TestPriorityQueue(unittest.IsolatedAsyncioTestCase):
+    async def test_strict_priority_then_fifo(self):
+        """Níveis mais altos saem primeiro; FIFO dentro do mesmo nível"""
+        queue = PriorityQueue()
+        for task, priority in (
+            ("low-1", "low"),
+            ("normal-1", "normal"),
+            ("realtime-1", "realtime"),
+            ("high-1", "high"),
+            ("normal-2", "normal"),
+        ):
+            await queue.add_task(task, priority)
+
+        order = [await queue.get_next_task() for _ in range(5)]
+
+        self.assertEqual(
+            order,
+            ["realtime-1", "high-1", "normal-1", "normal-2", "low-1"]
+        )
+        self.assertIsNone(await queue.get_next_task())
+
+    async def test_invalid_priority_raises(self):
+        """Prioridade fora de MAXSIZE é rejeitada"""
+        queue = PriorityQueue()
+        with self.assertRaises(ValueError):
+            await queue.add_task("task", "urgent")
+
+    async def test_full_level_blocks_until_consumed(self):
+        """add_task aguarda enquanto o nível está no limite de MAXSIZE"""
+        with patch.dict(PriorityQueue.MAXSIZE, {"realtime": 1}):
+            queue = PriorityQueue()
+            await queue.add_task("first", "realtime")
+
+            # Outro nível não é afetado pelo limite do realtime
+            await asyncio.wait_for(queue.add_task("other", "low"), timeout=1)
+
+            pending = asyncio.create_task(queue.add_task("second", "realtime"))
+            await asyncio.sleep(0.01)
+            self.assertFalse(pending.done())
+
+            self.assertEqual(await queue.get_next_task(), "first")
+            await asyncio.wait_for(pending, timeout=1)
+
+            self.assertEqual(await queue.get_next_task(), "second")
+            self.assertEqual(await queue.get_next_task(), "other")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Testes para o otimizador e o gerenciador de VRAM.
+"""
+
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+# Adicionar diretório src ao PYTHONPATH
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.core.gpu.vram_optimizer import VRAMManager, VRAMOptimizer
+
+
+class FakeGPUManager:
+    """Gerenciador de GPUs mínimo que devolve um status fixo"""
+    def __init__(self, status):
+        self.status = status
+
+    async def get_gpu_status(self):
+        return self.status
+
+
+class TestVRAMOptimizer(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        with patch.object(VRAMManager, "_load_workflow_estimates"):
+            self.vram_manager = VRAMManager()
+
+    async def test_optimize_once_rebalances_overloaded_gpu(self):
+        """Uma iteração rebalanceia só a GPU acima de 120% da média"""
+        gpu_manager = FakeGPUManager([
+            {"id": 0, "used_memory": 10_000},
+            {"id": 1, "used_memory": 2_000},
+        ])
+        optimizer = VRAMOptimizer(gpu_manager, self.vram_manager)
+
+        with patch.object(optimizer, "rebalance_gpu", new=AsyncMock()) as rebalance:
+            await optimizer.optimize_once()
+
+        rebalance.assert_awaited_once_with(0)
+
+    async def test_optimize_once_reads_unified_status_and_skips_failed(self):
+        """Status do gerenciador unificado (memory.used) e GPUs com falha"""
+        gpu_manager = FakeGPUManager([
+            {"id": 0, "failed": True, "memory": {"used": 50_000}},
+            {"id": 1, "failed": False, "memory": {"used": 4_000}},
+            {"id": 2, "failed": False, "memory": {"used": 4_000}},
+        ])
+        optimizer = VRAMOptimizer(gpu_manager, self.vram_manager)
+
+        with patch.object(optimizer, "rebalance_gpu", new=AsyncMock()) as rebalance:
+            await optimizer.optimize_once()
+
+        rebalance.assert_not_awaited()
+
+    async def test_optimize_once_reconciles_workloads(self):
+        """Após o rebalanceamento, a iteração carrega os modelos rastreados"""
+        optimizer = VRAMOptimizer(FakeGPUManager([]), self.vram_manager)
+        optimizer.workload_tracker["models"]["SDXL"] = {}
+
+        await optimizer.optimize_once()
+
+        self.assertTrue(self.vram_manager.models["SDXL"]["loaded"])
+
+
+class TestVRAMManagerEstimates(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        with patch.object(VRAMManager, "_load_workflow_estimates"):
+            self.vram_manager = VRAMManager()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.vram_manager._estimates_path = Path(tmp_dir.name) / "vram_estimates.json"
+
+    async def test_lru_evicts_least_recently_used(self):
+        """Acima de MAX_ESTIMATES sai a estimativa menos usada, não a mais antiga"""
+        self.vram_manager.MAX_ESTIMATES = 2
+        wf_a, wf_b, wf_c = {"1": {}}, {"1": {}, "2": {}}, {"1": {}, "2": {}, "3": {}}
+
+        await self.vram_manager.estimate_workflow_vram(wf_a)
+        await self.vram_manager.estimate_workflow_vram(wf_b)
+        # Acerto no cache renova wf_a
+        self.assertEqual(await self.vram_manager.estimate_workflow_vram(wf_a), 4500)
+        await self.vram_manager.estimate_workflow_vram(wf_c)
+
+        self.assertEqual(list(self.vram_manager.workflow_vram_estimates.values()), [4500, 5500])
+
+    async def test_flushes_atomically_every_n_new_estimates(self):
+        """A cada FLUSH_EVERY novas entradas o JSON é gravado sem deixar temporário"""
+        self.vram_manager.FLUSH_EVERY = 2
+        path = self.vram_manager._estimates_path
+
+        await self.vram_manager.estimate_workflow_vram({"1": {}})
+        self.assertFalse(path.exists())
+
+        await self.vram_manager.estimate_workflow_vram({"1": {}, "2": {}})
+        self.assertEqual(
+            json.loads(path.read_text()),
+            dict(self.vram_manager.workflow_vram_estimates)
+        )
+        self.assertFalse(path.with_suffix(".json.tmp").exists())
+        self.assertEqual(self.vram_manager._pending_flush, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()